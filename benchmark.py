@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for python-twitapi.
+
+Usage::
+
+    python benchmark.py [import] [json] [urls]
+
+Runs the given benchmarks, or all of them.
+
+import
+    Time taken by "import twitapi" in a new interpreter, and a check that it
+    doesn't import any of the modules that are meant to be loaded lazily
+    (httplib2, oauth2, the JSON backends, threading, ...).
+
+json
+    Decoding time of each installed JSON backend over payloads shaped like
+    a home timeline page (200 statuses), a search page (100 results) and a
+    followers_ids page (5000 ids). Backends that decode a payload with
+    escaped slashes differently from json are reported and skipped.
+
+urls
+    Time to build the url and parameters of a request for a few typical
+    methods, without sending it.
+"""
+
+import os
+import sys
+import time
+import timeit
+import subprocess
+
+import twitapi
+
+
+def make_user(i):
+    return {
+        "id": 1000 + i, "screen_name": "user%d" % i, "name": "User %d" % i,
+        "location": "Somewhere", "description": "Just a user " * 5,
+        "followers_count": i * 10, "friends_count": i, "statuses_count": i,
+        "profile_image_url": "http://a1.twimg.com/profile_images/%d.png" % i,
+        "protected": False, "verified": False, "utc_offset": -18000,
+        "created_at": "Wed Mar 03 19:37:35 +0000 2010",
+    }
+
+
+def make_status(i):
+    return {
+        "id": 10000000 + i, "text": u"Status number %d with #python @r1cky "
+                                    u"and some more words \u2603" % i,
+        "created_at": "Sat Mar 20 18:26:43 +0000 2010",
+        "source": "<a href=\"http://github.com\">twitapi</a>",
+        "truncated": False, "favorited": False,
+        "in_reply_to_status_id": None, "in_reply_to_user_id": None,
+        "in_reply_to_screen_name": None, "geo": None,
+        "user": make_user(i % 50),
+    }
+
+
+def make_search_result(i):
+    return {
+        "id": 10000000 + i, "text": u"Search result %d about #beer" % i,
+        "from_user": "user%d" % i, "from_user_id": 1000 + i,
+        "to_user_id": None, "iso_language_code": "en",
+        "profile_image_url": "http://a1.twimg.com/profile_images/%d.png" % i,
+        "created_at": "Sat, 20 Mar 2010 18:26:43 +0000",
+        "source": "&lt;a href=&quot;http://github.com&quot;&gt;web&lt;/a&gt;",
+    }
+
+
+def payloads():
+    """
+    Returns (name, json bytes) for each benchmark payload.
+    """
+    import json
+    return [
+        ('timeline', json.dumps([make_status(i) for i in range(200)])),
+        ('search', json.dumps({"results": [make_search_result(i)
+                                           for i in range(100)],
+                               "max_id": 10000099, "page": 1,
+                               "query": "beer", "results_per_page": 100})),
+        ('ids', json.dumps({"ids": range(10000, 15000),
+                            "next_cursor": 1333504313713126852,
+                            "previous_cursor": 0})),
+    ]
+
+
+def bench_json(number=50):
+    import json
+    data = payloads()
+    print "%-12s %10s %10s %10s  (ms per decode)" % (
+        ('backend',) + tuple([name for name, payload in data]))
+    check = json.dumps({"url": "http://twitter.com/r1cky",
+                        "source": "<a href=\"http://github.com\">web</a>",
+                        "text": u"\u2603"}).replace('/', '\\/')
+    for backend in twitapi.JSON_BACKENDS + ('cjson',):
+        try:
+            loads, errors = twitapi.load_json_backend(backend)
+        except ImportError:
+            continue
+        if loads(check) != json.loads(check):
+            print "%-12s decodes differently from json, skipped" % backend
+            continue
+        times = []
+        for name, payload in data:
+            seconds = min(timeit.repeat(lambda: loads(payload), number=number,
+                                        repeat=3))
+            times.append(seconds * 1000 / number)
+        print "%-12s %10.3f %10.3f %10.3f" % ((backend,) + tuple(times))
+
+
+class NullAuth(object):
+    """
+    Returns an empty response without making a request.
+    """
+    def make_request(self, url, method="GET", body=None, headers=None,
+                     cache=None, timeout=None, proxy_info=None):
+        return {'status': '200'}, ''
+
+
+def bench_urls(number=100000):
+    client = twitapi.Client(NullAuth())
+    calls = [
+        ('search', lambda: client.search('beer', rpp=100, page=2)),
+        ('statuses_user_timeline',
+         lambda: client.statuses_user_timeline(screen_name='r1cky',
+                                               count=200, max_id=12345678)),
+        ('followers_ids',
+         lambda: client.followers_ids(user_id=12, cursor=-1)),
+        ('get_list_statuses',
+         lambda: client.get_list_statuses('r1cky', 'friends', per_page=50)),
+    ]
+    print "%-24s %10s  (us per call)" % ('method', 'time')
+    for name, call in calls:
+        seconds = min(timeit.repeat(call, number=number, repeat=3))
+        print "%-24s %10.3f" % (name, seconds * 1000000 / number)
+
+
+# Modules that must not be imported by "import twitapi".
+LAZY_MODULES = ('httplib2', 'oauth2', 'json', 'simplejson', 'ujson', 'cjson',
+                'threading', 'multiprocessing', 'shelve')
+
+
+def time_python(code, number=20):
+    """
+    Returns the best wall time of running `code` in a new interpreter.
+    """
+    best = None
+    for i in range(number):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_import():
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = 'import sys; sys.path.insert(0, %r); ' % here
+    startup = time_python(code + 'pass')
+    imported = time_python(code + 'import twitapi')
+    print "%-24s %10.3f  (ms)" % ('interpreter', startup * 1000)
+    print "%-24s %10.3f  (ms)" % ('import twitapi', imported * 1000)
+    print "%-24s %10.3f  (ms)" % ('difference', (imported - startup) * 1000)
+
+    check = subprocess.Popen([sys.executable, '-c', code +
+        'import twitapi; print " ".join([m for m in %r if m in sys.modules])'
+        % (LAZY_MODULES,)], stdout=subprocess.PIPE).communicate()[0].split()
+    if check:
+        print "FAIL: import twitapi loaded %s" % ", ".join(check)
+        sys.exit(1)
+
+
+BENCHMARKS = {
+    'import': bench_import,
+    'json': bench_json,
+    'urls': bench_urls,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or sorted(BENCHMARKS):
+        print "== %s" % name
+        BENCHMARKS[name]()
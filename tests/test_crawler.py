@@ -0,0 +1,97 @@
+"""
+Tests for twitapi.crawler.
+
+Run with ``python -m unittest discover -s tests``.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twitapi.crawler import Crawler
+
+FOLLOWERS = {
+    12: range(100, 110),
+    13: range(200, 230),
+    14: range(300, 305),
+}
+PAGE_SIZE = 10
+
+
+class FakeClient(object):
+    """
+    Serves followers_ids in pages of PAGE_SIZE ids. The first time the
+    second page of user 13 is asked for, the process exits on the spot as
+    if it had crashed.
+    """
+    directory = None
+
+    def followers_ids(self, user_id=None, cursor=-1):
+        log = open(os.path.join(self.directory, 'requests.log'), 'a')
+        log.write('%s %s\n' % (user_id, cursor))
+        log.close()
+        start = max(cursor, 0)
+        marker = os.path.join(self.directory, 'crashed')
+        if user_id == 13 and start == PAGE_SIZE and \
+                                            not os.path.exists(marker):
+            open(marker, 'w').close()
+            os._exit(1)
+        ids = FOLLOWERS[user_id]
+        next_cursor = start + PAGE_SIZE
+        if next_cursor >= len(ids):
+            next_cursor = 0
+        return {'status': '200'}, {'ids': ids[start:start + PAGE_SIZE],
+                                   'next_cursor': next_cursor}
+
+    def verify_credentials(self):
+        return {'status': '200'}, {}
+
+
+def make_client():
+    return FakeClient()
+
+
+class CrawlerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        FakeClient.directory = self.directory
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def requests(self):
+        f = open(os.path.join(self.directory, 'requests.log'))
+        try:
+            return [line.split() for line in f]
+        finally:
+            f.close()
+
+    def test_dead_worker_job_is_resumed(self):
+        crawler = Crawler(make_client, os.path.join(self.directory, 'crawl'),
+                          processes=2)
+        results = crawler.crawl('followers_ids', [12, 13, 14])
+        self.assertTrue(os.path.exists(os.path.join(self.directory,
+                                                    'crashed')))
+        self.assertEqual(sorted(results), [12, 13, 14])
+        for user_id, ids in FOLLOWERS.items():
+            self.assertEqual(results[user_id], ids)
+        # the first page of user 13 was checkpointed and not fetched again
+        self.assertEqual(self.requests().count(['13', '-1']), 1)
+        self.assertEqual(self.requests().count(['13', str(PAGE_SIZE)]), 2)
+
+    def test_job_given_up_after_max_restarts(self):
+        crawler = Crawler(make_client, os.path.join(self.directory, 'crawl'),
+                          processes=1, max_restarts=0)
+        results = crawler.crawl('followers_ids', [13, 14])
+        self.assertEqual(sorted(results), [14])
+        # the next crawl resumes the job that was given up
+        results = crawler.crawl('followers_ids', [13, 14])
+        self.assertEqual(results[13], FOLLOWERS[13])
+
+
+if __name__ == '__main__':
+    unittest.main()
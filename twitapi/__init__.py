@@ -22,18 +22,12 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-import httplib2
-import oauth2
-from urllib import urlencode
+import copy
+import heapq
+import time
 from datetime import date as datetype
-try:
-    import json # python 2.6
-except ImportError:
-    import simplejson as json # python 2.4 to 2.5
-try:
-    from urlparse import parse_qs, parse_qsl
-except ImportError:
-    from cgi import parse_qs, parse_qsl
+import os
+import re
 
 REQUEST_TOKEN_URL = 'http://twitter.com/oauth/request_token'
 ACCESS_TOKEN_URL = 'http://twitter.com/oauth/access_token'
@@ -44,23 +38,220 @@ DEFAULT_HTTP_HEADERS = {
     "User-Agent" : "python-twitapi/0.1 (http://github.com/rlr/python-twitapi)"
 }
 
+# JSON decoders in order of preference (fastest first). The first one that
+# can be imported is used, unless another one is picked with
+# set_json_backend() or the TWITAPI_JSON_BACKEND environment variable.
+# python-cjson decodes "\\/" wrongly (as "\\/" instead of "/"), so it is
+# only used when picked explicitly.
+JSON_BACKENDS = ('ujson', 'simplejson', 'json')
+
+# Request priorities, lower runs first.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+
+class JSONDecodeError(ValueError):
+    """
+    Raised when a successful response can't be decoded as json.
+    """
+    def __init__(self, message, resp=None, content=None):
+        ValueError.__init__(self, message)
+        self.resp = resp
+        self.content = content
+
+
+def load_json_backend(name):
+    """
+    Returns the (loads, errors) of a JSON backend, where errors is the tuple
+    of exceptions it raises for invalid input. Raises ImportError if the
+    backend isn't installed.
+    """
+    if name == 'ujson':
+        import ujson
+        return ujson.loads, (ValueError,)
+    if name == 'cjson':
+        import cjson
+        return cjson.decode, (cjson.DecodeError, ValueError)
+    if name == 'simplejson':
+        import simplejson
+        return simplejson.loads, (ValueError,)
+    if name == 'json':
+        import json
+        return json.loads, (ValueError,)
+    raise ImportError("Unknown JSON backend %s." % name)
+
+
+def set_json_backend(name=None):
+    """
+    Select the JSON backend used to decode responses.
+    
+    With no name, the TWITAPI_JSON_BACKEND environment variable or else the
+    first installed backend of JSON_BACKENDS is used.
+    Returns the name of the selected backend.
+    """
+    global json_backend, json_loads, json_errors
+    if name is None:
+        name = os.environ.get('TWITAPI_JSON_BACKEND')
+    if name:
+        names = (name,)
+    else:
+        names = JSON_BACKENDS
+    for backend in names:
+        try:
+            json_loads, json_errors = load_json_backend(backend)
+        except ImportError:
+            if name:
+                raise
+            continue
+        json_backend = backend
+        return backend
+    raise ImportError("No JSON backend is installed.")
+
+
+def decode_json(content, resp=None):
+    """
+    Decode a json response body with the selected backend.
+    
+    The body is decoded straight from the bytes returned by httplib2. Raises
+    JSONDecodeError if it isn't valid json.
+    """
+    if json_loads is None:
+        set_json_backend()
+    try:
+        return json_loads(content)
+    except json_errors, e:
+        raise JSONDecodeError("Invalid json response: %s" % e, resp, content)
+
+
+# The backend is picked on the first decode, see set_json_backend().
+json_backend = json_loads = json_errors = None
+
+
+class RequestExpired(Exception):
+    """
+    Raised when a queued request reaches its deadline before being sent.
+    """
+
+
+class RequestScheduler(object):
+    """
+    Request Scheduler
+    
+    Orders the requests of the clients that share it by priority, so that
+    interactive calls don't wait behind bulk crawls. At most `concurrency`
+    requests are in flight at once, and the last `reserve` requests of the
+    rate limit window (as reported by the X-RateLimit-* headers) are kept
+    for PRIORITY_HIGH requests.
+    
+    Requests queued with a deadline are dropped with RequestExpired if they
+    can't be sent in time.
+    """
+    def __init__(self, concurrency=1, reserve=0):
+        import threading
+        self.concurrency = concurrency
+        self.reserve = reserve
+        self.remaining = None
+        self.reset = None
+        self.active = 0
+        self.waiting = []
+        self.counter = 0
+        self.condition = threading.Condition()
+    
+    def _budget_wait(self, priority):
+        """
+        Returns how long a request of the given priority has to wait for
+        rate limit budget (0 if it can go now, None if unknown).
+        """
+        if self.remaining is None:
+            return 0
+        reserve = 0
+        if priority != PRIORITY_HIGH:
+            reserve = self.reserve
+        if self.remaining > reserve:
+            return 0
+        if self.reset is None or self.reset <= time.time():
+            # the window is over, the next response will tell the new budget
+            self.remaining = None
+            return 0
+        return self.reset - time.time()
+    
+    def acquire(self, priority=PRIORITY_NORMAL, deadline=None):
+        """
+        Block until a request of the given priority can be sent.
+        
+        deadline is the number of seconds the request may wait in the queue.
+        """
+        expires = None
+        if deadline is not None:
+            expires = time.time() + deadline
+        self.condition.acquire()
+        try:
+            self.counter += 1
+            entry = (priority, self.counter)
+            heapq.heappush(self.waiting, entry)
+            while True:
+                wait = None
+                if self.waiting[0] == entry and \
+                                        self.active < self.concurrency:
+                    wait = self._budget_wait(priority)
+                    if not wait:
+                        heapq.heappop(self.waiting)
+                        self.active += 1
+                        if self.remaining is not None:
+                            self.remaining -= 1
+                        self.condition.notifyAll()
+                        return
+                if expires is not None:
+                    left = expires - time.time()
+                    if left <= 0:
+                        self.waiting.remove(entry)
+                        heapq.heapify(self.waiting)
+                        self.condition.notifyAll()
+                        raise RequestExpired("Request deadline exceeded.")
+                    if wait is None or left < wait:
+                        wait = left
+                self.condition.wait(wait)
+        finally:
+            self.condition.release()
+    
+    def release(self, resp=None):
+        """
+        Mark a request as done, updating the rate limit budget from the
+        response headers.
+        """
+        self.condition.acquire()
+        try:
+            self.active -= 1
+            if resp is not None:
+                if resp.get('x-ratelimit-remaining') is not None:
+                    self.remaining = int(resp['x-ratelimit-remaining'])
+                if resp.get('x-ratelimit-reset') is not None:
+                    self.reset = float(resp['x-ratelimit-reset'])
+            self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
 
 class NoAuth(object):
     """
     No Authentitcation
     """
     def make_request(self, url, method="GET", body=None, headers=None,
-                     cache=None, timeout=None, proxy_info=None):
+                     cache=None, timeout=None, proxy_info=None,
+                     connection_type=None):
         """
         Make a request using no authentication.
         """
+        import httplib2
         client = httplib2.Http(
                               cache=cache,
                               timeout=timeout,
                               proxy_info=proxy_info
                               )
         
-        return client.request(url, method, body)
+        return client.request(url, method, body,
+                              connection_type=connection_type)
 
 
 class BasicAuth(object):
@@ -74,11 +265,13 @@ class BasicAuth(object):
         self.password = password
     
     def make_request(self, url, method="GET", body=None, headers=None,
-                     cache=None, timeout=None, proxy_info=None):
+                     cache=None, timeout=None, proxy_info=None,
+                     connection_type=None):
         """
         Make a request using Basic Authentication using the username
         and passowor provided.
         """
+        import httplib2
         client = httplib2.Http(
                               cache=cache,
                               timeout=timeout,
@@ -86,7 +279,8 @@ class BasicAuth(object):
                               )
         
         client.add_credentials(self.username, self.password)
-        return client.request(url, method, body)
+        return client.request(url, method, body,
+                              connection_type=connection_type)
 
 
 class OAuth(object):
@@ -95,14 +289,16 @@ class OAuth(object):
     
     It uses the application's consumer key and secret and user's access token
     key and secret for access to the Twitter API.
+    
+    The oauth2 library is only imported when a request is first signed.
     """
-    consumer = None
     token = None
+    _consumer = None
     
     def __init__(self, consumer_key, consumer_secret,
                  token=None, token_secret=None):
-        self.consumer = oauth2.Consumer(key=consumer_key,
-                                         secret=consumer_secret)
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
         if token and token_secret:
             self.token = {
                            "oauth_token":token, 
@@ -111,16 +307,28 @@ class OAuth(object):
         else:
             self.token = None
     
+    def _get_consumer(self):
+        if self._consumer is None:
+            import oauth2
+            self._consumer = oauth2.Consumer(key=self.consumer_key,
+                                             secret=self.consumer_secret)
+        return self._consumer
+
+    def _set_consumer(self, consumer):
+        self._consumer = consumer
+    consumer = property(_get_consumer, _set_consumer)
+    
     def get_request_token(self, request_token_url=REQUEST_TOKEN_URL):
         """
         Get the oauth request token.
         """
+        import oauth2
         client = oauth2.Client(self.consumer)
         resp, content = client.request(request_token_url, "GET")
         if resp['status'] != '200':
             raise Exception("Invalid response %s." % resp['status'])
         
-        return dict(parse_qsl(content))
+        return parse_token(content)
     
     def get_authorization_url(self, token=None, authorize_url=AUTHORIZE_URL):
         '''
@@ -155,6 +363,7 @@ class OAuth(object):
         This should be called after user has authorized/authenticated.
         If a PIN was provided, it should be passed as the oauth_verifier.
         """
+        import oauth2
         token = oauth2.Token(self.token['oauth_token'],
                              self.token['oauth_token_secret'])
         if oauth_verifier:
@@ -166,20 +375,32 @@ class OAuth(object):
         if resp['status'] != '200':
             raise Exception("Invalid response %s." % resp['status'])
         
-        return dict(parse_qsl(content))
+        return parse_token(content)
 
     def set_token(self, token):
         """
         Set the oauth token.
         """
         self.token = token
+    
+    def for_token(self, token):
+        """
+        Returns a copy of this OAuth that signs requests with the given
+        token, sharing the consumer instead of building a new one.
+        """
+        self._get_consumer()
+        auth = copy.copy(self)
+        auth.token = token
+        return auth
 
     def make_request(self, url, method="GET", body=None, headers=None,
-                     cache=None, timeout=None, proxy_info=None):
+                     cache=None, timeout=None, proxy_info=None,
+                     connection_type=None):
         """
         Make a request using OAuth authentication with the consumer key and
         secret and the provided token.
         """
+        import oauth2
         token = oauth2.Token(self.token['oauth_token'],
                              self.token['oauth_token_secret'])
         client = oauth2.Client(
@@ -190,7 +411,338 @@ class OAuth(object):
                               proxy_info=proxy_info
                               )
         
-        return client.request(url, method, body)
+        return client.request(url, method, body,
+                              connection_type=connection_type)
+
+
+PATH_PARAM_RE = re.compile(r'%\((\w+)\)s')
+
+TIMELINE_PARAMS = ('since_id', 'max_id', 'count', 'page')
+USER_PARAMS = ('user_id', 'screen_name')
+
+# The Twitter API methods: (name, http method, base url, path, parameters).
+# Path parameters are written as %(name)s in the path, a parameters value of
+# None means any keyword argument is passed through.
+ENDPOINT_TABLE = (
+    # Search API
+    ('search', 'GET', 'search', '/search.json', None),
+    ('trends', 'GET', 'search', '/trends.json', ()),
+    ('trends_current', 'GET', 'search', '/trends/current.json', ('exclude',)),
+    ('trends_daily', 'GET', 'search', '/trends/daily.json',
+     ('date', 'exclude')),
+    ('trends_weekly', 'GET', 'search', '/trends/weekly.json',
+     ('date', 'exclude')),
+    # Timelines
+    ('statuses_home_timeline', 'GET', 'api', '/statuses/home_timeline.json',
+     TIMELINE_PARAMS),
+    ('statuses_friends_timeline', 'GET', 'api',
+     '/statuses/friends_timeline.json', TIMELINE_PARAMS),
+    ('statuses_user_timeline', 'GET', 'api', '/statuses/user_timeline.json',
+     USER_PARAMS + TIMELINE_PARAMS),
+    ('statuses_mentions', 'GET', 'api', '/statuses/mentions.json',
+     TIMELINE_PARAMS),
+    ('statuses_retweeted_by_me', 'GET', 'api',
+     '/statuses/retweeted_by_me.json', TIMELINE_PARAMS),
+    ('statuses_retweeted_to_me', 'GET', 'api',
+     '/statuses/retweeted_to_me.json', TIMELINE_PARAMS),
+    ('statuses_retweeted_of_me', 'GET', 'api',
+     '/statuses/retweeted_of_me.json', TIMELINE_PARAMS),
+    # Statuses
+    ('statuses_show', 'GET', 'api', '/statuses/show/%(id)s.json', ()),
+    ('statuses_update', 'POST', 'api', '/statuses/update.json',
+     ('status', 'in_reply_to_status_id', 'lat', 'long', 'place_id',
+      'display_coordinates')),
+    ('statuses_destroy', 'POST', 'api', '/statuses/destroy/%(id)s.json', ()),
+    ('statuses_retweet', 'POST', 'api', '/statuses/retweet/%(id)s.json', ()),
+    ('statuses_retweets', 'GET', 'api', '/statuses/retweets/%(id)s.json',
+     ('count',)),
+    # Users
+    ('users_show', 'GET', 'api', '/users/show.json', USER_PARAMS),
+    ('users_lookup', 'GET', 'api', '/users/lookup.json', USER_PARAMS),
+    ('users_search', 'GET', 'api', '/users/search.json',
+     ('q', 'per_page', 'page')),
+    ('users_suggestions', 'GET', 'api', '/users/suggestions.json', ()),
+    ('users_suggestions_category', 'GET', 'api',
+     '/users/suggestions/%(slug)s.json', ()),
+    ('statuses_friends', 'GET', 'api', '/statuses/friends.json',
+     USER_PARAMS + ('cursor',)),
+    ('statuses_followers', 'GET', 'api', '/statuses/followers.json',
+     USER_PARAMS + ('cursor',)),
+    # Lists
+    ('create_list', 'POST', 'api', '/%(user)s/lists.json',
+     ('name', 'mode', 'description')),
+    ('update_list', 'POST', 'api', '/%(user)s/lists/%(id)s.json',
+     ('name', 'mode', 'description')),
+    ('get_lists', 'GET', 'api', '/%(user)s/lists.json', ('cursor',)),
+    ('get_list', 'GET', 'api', '/%(user)s/lists/%(id)s.json', ()),
+    ('delete_list', 'DELETE', 'api', '/%(user)s/lists/%(id)s.json', ()),
+    ('get_list_statuses', 'GET', 'api',
+     '/%(user)s/lists/%(list_id)s/statuses.json',
+     ('since_id', 'max_id', 'per_page', 'page')),
+    ('get_list_memberships', 'GET', 'api', '/%(user)s/lists/memberships.json',
+     ('cursor',)),
+    ('get_list_subscriptions', 'GET', 'api',
+     '/%(user)s/lists/subscriptions.json', ('cursor',)),
+    # List members
+    ('get_list_members', 'GET', 'api', '/%(user)s/%(list_id)s/members.json',
+     ('cursor',)),
+    ('add_list_member', 'POST', 'api', '/%(user)s/%(list_id)s/members.json',
+     ('id',)),
+    ('delete_list_member', 'DELETE', 'api',
+     '/%(user)s/%(list_id)s/members.json', ('id',)),
+    ('get_list_members_id', 'GET', 'api',
+     '/%(user)s/%(list_id)s/members/%(id)s.json', ()),
+    # List subscribers
+    ('get_list_subscribers', 'GET', 'api',
+     '/%(user)s/%(list_id)s/subscribers.json', ('cursor',)),
+    ('subscribe_to_list', 'POST', 'api',
+     '/%(user)s/%(list_id)s/subscribers.json', ()),
+    ('unsubscribe_from_list', 'DELETE', 'api',
+     '/%(user)s/%(list_id)s/subscribers.json', ()),
+    ('get_list_subscribers_id', 'GET', 'api',
+     '/%(user)s/%(list_id)s/subscribers/%(id)s.json', ()),
+    # Direct messages
+    ('direct_messages', 'GET', 'api', '/direct_messages.json',
+     TIMELINE_PARAMS),
+    ('direct_messages_sent', 'GET', 'api', '/direct_messages/sent.json',
+     TIMELINE_PARAMS),
+    ('direct_messages_new', 'POST', 'api', '/direct_messages/new.json',
+     ('user', 'text')),
+    ('direct_messages_destroy', 'DELETE', 'api',
+     '/direct_messages/destroy/%(id)s.json', ()),
+    # Friendships
+    ('friendships_create', 'POST', 'api', '/friendships/create.json',
+     USER_PARAMS + ('follow',)),
+    ('friendships_destroy', 'POST', 'api', '/friendships/destroy.json',
+     USER_PARAMS),
+    ('friendships_exists', 'GET', 'api', '/friendships/exists.json',
+     ('user_a', 'user_b')),
+    # Social graph
+    ('friends_ids', 'GET', 'api', '/friends/ids.json',
+     USER_PARAMS + ('cursor',)),
+    ('followers_ids', 'GET', 'api', '/followers/ids.json',
+     USER_PARAMS + ('cursor',)),
+    # Account
+    ('verify_credentials', 'GET', 'api', '/account/verify_credentials.json',
+     ()),
+    ('rate_limit_status', 'GET', 'api', '/account/rate_limit_status.json', ()),
+)
+
+
+def parse_token(content):
+    """
+    Utility function that parses an oauth token response into a dict.
+    """
+    try:
+        from urlparse import parse_qsl
+    except ImportError:
+        from cgi import parse_qsl
+    return dict(parse_qsl(content))
+
+
+def encode_param(value):
+    """
+    Utility function that url encodes a parameter value.
+    """
+    from urllib import quote_plus
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return quote_plus(str(value))
+
+
+class Endpoint(object):
+    """
+    A Twitter API method, compiled from an ENDPOINT_TABLE entry.
+    
+    The url template and the list of query/body parameters are worked out
+    once, so building a request only formats the path and encodes the
+    parameters that were set.
+    """
+    def __init__(self, name, http_method, base, path, params):
+        self.name = name
+        self.http_method = http_method
+        self.base_attr = 'base_%s_url' % base
+        self.path = path
+        self.path_params = tuple(PATH_PARAM_RE.findall(path))
+        if params is None:
+            self.params = None
+        else:
+            self.params = tuple([(p, p + '=') for p in params])
+        self.in_body = http_method == 'POST'
+    
+    def encode(self, kwargs):
+        """
+        Returns the url encoded parameters that are set (not None).
+        """
+        if self.params is None:
+            items = [(k, k + '=') for k in sorted(kwargs)
+                     if k not in self.path_params]
+        else:
+            items = self.params
+        encoded = []
+        for name, prefix in items:
+            value = kwargs.get(name)
+            if value is not None:
+                encoded.append(prefix + encode_param(value))
+        return '&'.join(encoded)
+    
+    def build(self, base_url, kwargs):
+        """
+        Returns the (url, body) of a request to this method.
+        """
+        url = base_url + (self.path_params and self.path % kwargs or self.path)
+        params = self.encode(kwargs)
+        if self.in_body:
+            return url, params
+        if params:
+            url = url + '?' + params
+        return url, None
+
+
+ENDPOINTS = dict([(entry[0], Endpoint(*entry)) for entry in ENDPOINT_TABLE])
+
+
+_connection_types = {}
+
+def timeout_connection_type(scheme, read_timeout):
+    """
+    Returns an httplib2 connection class that connects with the Http
+    timeout and then switches the socket to `read_timeout` for reading the
+    response.
+    """
+    key = (scheme, read_timeout)
+    if key not in _connection_types:
+        import httplib2
+        if scheme == 'https':
+            base = httplib2.HTTPSConnectionWithTimeout
+        else:
+            base = httplib2.HTTPConnectionWithTimeout
+        
+        class ReadTimeoutConnection(base):
+            def connect(self):
+                base.connect(self)
+                if self.sock is not None:
+                    self.sock.settimeout(read_timeout)
+        
+        _connection_types[key] = ReadTimeoutConnection
+    return _connection_types[key]
+
+
+# Idempotent GET methods that may be hedged.
+HEDGED_ENDPOINTS = ('statuses_show', 'users_show', 'users_lookup', 'search',
+                    'friendships_exists')
+
+
+class Hedger(object):
+    """
+    Hedged Requests
+    
+    Sends a second, identical request when the first hasn't answered within
+    the `percentile` latency of recent requests, and returns whichever
+    answers first. Only the GET methods among `endpoints` are hedged (any
+    other method is sent once, as usual), and the extra requests are capped
+    at `max_extra` of all requests, since each one spends rate limit.
+    
+    A Hedger can be shared by clients used from several threads.
+    """
+    def __init__(self, percentile=95, max_extra=0.05, default_delay=1.0,
+                 min_samples=20, window=500, endpoints=HEDGED_ENDPOINTS):
+        import threading
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.endpoints = frozenset(endpoints)
+        self.samples = []
+        self.requests = 0
+        self.extra = 0
+        self.lock = threading.Lock()
+    
+    def record(self, latency):
+        self.lock.acquire()
+        try:
+            self.samples.append(latency)
+            if len(self.samples) > self.window:
+                del self.samples[:len(self.samples) - self.window]
+        finally:
+            self.lock.release()
+    
+    def delay(self):
+        """
+        Returns how long to wait before sending the hedge request.
+        """
+        self.lock.acquire()
+        try:
+            samples = sorted(self.samples)
+        finally:
+            self.lock.release()
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        index = int(len(samples) * self.percentile / 100.0)
+        return samples[min(index, len(samples) - 1)]
+    
+    def can_hedge(self):
+        return self.extra < self.max_extra * self.requests
+    
+    def _start_request(self):
+        self.lock.acquire()
+        try:
+            self.requests += 1
+        finally:
+            self.lock.release()
+    
+    def _start_hedge(self):
+        # Checks the cap and counts the hedge as one step, so concurrent
+        # calls can't all pass the check before any of them counts.
+        self.lock.acquire()
+        try:
+            if not self.can_hedge():
+                return False
+            self.extra += 1
+            return True
+        finally:
+            self.lock.release()
+    
+    def call(self, send):
+        """
+        Call `send` (which makes the request), hedging it if it's slow.
+        """
+        import threading
+        from Queue import Queue, Empty
+        
+        results = Queue()
+        def run():
+            start = time.time()
+            try:
+                results.put((True, send(), time.time() - start))
+            except Exception, e:
+                results.put((False, e, time.time() - start))
+        
+        def start():
+            thread = threading.Thread(target=run)
+            thread.setDaemon(True)
+            thread.start()
+        
+        self._start_request()
+        start()
+        pending = 1
+        try:
+            result = results.get(timeout=self.delay())
+        except Empty:
+            if self._start_hedge():
+                start()
+                pending += 1
+            result = results.get()
+        pending -= 1
+        if not result[0] and pending:
+            # the first one to finish failed, wait for the other one
+            result = results.get()
+        ok, value, latency = result
+        self.record(latency)
+        if not ok:
+            raise value
+        return value
 
 
 class Client(object):
@@ -201,6 +753,23 @@ class Client(object):
     authentication at all (for the methods that allow that).
     
     To use.....
+    
+    Clients that share a credential can also share a RequestScheduler, so
+    that requests from a client with a higher priority go first::
+    
+        scheduler = RequestScheduler(reserve=20)
+        crawler = Client(auth, scheduler=scheduler, priority=PRIORITY_LOW,
+                         deadline=300)
+        interactive = crawler.with_priority(PRIORITY_HIGH)
+    
+    connect_timeout and read_timeout set separate limits for connecting and
+    for waiting on the response (each defaults to timeout, so
+    Client(timeout=30, connect_timeout=2) still waits 30s for responses).
+    Passing a Hedger as hedger turns on hedged requests for idempotent GET
+    methods.
+    
+    A user_cache (see twitapi.users.UserCache) is filled with the users of
+    every successful response.
     """
     auth = None
     base_api_url = None
@@ -208,10 +777,19 @@ class Client(object):
     cache = None
     timeout = None
     proxy_info = None
+    scheduler = None
+    priority = PRIORITY_NORMAL
+    deadline = None
+    connect_timeout = None
+    read_timeout = None
+    hedger = None
+    user_cache = None
     
     def __init__(self, auth=None, base_api_url="http://api.twitter.com/1",
                  base_search_url="http://search.twitter.com", cache=None,
-                 timeout=None, proxy_info=None):
+                 timeout=None, proxy_info=None, scheduler=None,
+                 priority=PRIORITY_NORMAL, deadline=None, connect_timeout=None,
+                 read_timeout=None, hedger=None, user_cache=None):
         if not auth:
             auth = NoAuth()
             
@@ -221,28 +799,81 @@ class Client(object):
         self.cache = cache
         self.timeout = timeout
         self.proxy_info = proxy_info
+        self.scheduler = scheduler
+        self.priority = priority
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.hedger = hedger
+        self.user_cache = user_cache
+    
+    def _call(self, endpoint_name, **kwargs):
+        """
+        Make a request to the Twitter API method `endpoint_name` of
+        ENDPOINTS.
+        """
+        endpoint = ENDPOINTS[endpoint_name]
+        url, body = endpoint.build(getattr(self, endpoint.base_attr), kwargs)
+        if self.hedger is not None and endpoint.http_method == "GET" and \
+                                    endpoint_name in self.hedger.endpoints:
+            return self.hedger.call(lambda: self.request(url,
+                                            endpoint.http_method, body))
+        return self.request(url, endpoint.http_method, body)
+    
+    def with_priority(self, priority, deadline=None):
+        """
+        Returns a copy of the client, sharing its authentication and
+        scheduler, that makes requests with the given priority and deadline.
+        """
+        client = copy.copy(self)
+        client.priority = priority
+        client.deadline = deadline
+        return client
     
     def request(self, url, method="GET", body=None, headers=None):
         """
         Make a request with the provided authentication.
         
         The response is assumed to be json and is parsed to a dict that is
-        returned along with the response headers. If an exception is caught while
-        decoding the json, then the raw response body is returned (should only happen
-        if status != '200').
-        NOTE: Feels ugly.. Should I be doing this in a different way?
+        returned along with the response headers. Error responses
+        (status != '200') that aren't json are returned as the raw response
+        body, while a '200' response that can't be decoded raises
+        JSONDecodeError.
         """
         if headers is None:
             headers = DEFAULT_HTTP_HEADERS.copy()
         
-        resp, content = self.auth.make_request(url, method, body, headers,
-                                 self.cache, self.timeout, self.proxy_info)
-        try:
-        	decoded = json.loads(content)
-        	content = decoded
-        except:
-            pass
-            
+        timeout = self.connect_timeout or self.timeout
+        read_timeout = self.read_timeout or self.timeout
+        kwargs = {}
+        if read_timeout and read_timeout != timeout:
+            kwargs['connection_type'] = timeout_connection_type(
+                                        url.split(':', 1)[0], read_timeout)
+        
+        if self.scheduler is None:
+            resp, content = self.auth.make_request(url, method, body, headers,
+                                 self.cache, timeout, self.proxy_info,
+                                 **kwargs)
+        else:
+            self.scheduler.acquire(self.priority, self.deadline)
+            resp = None
+            try:
+                resp, content = self.auth.make_request(url, method, body,
+                                 headers, self.cache, timeout,
+                                 self.proxy_info, **kwargs)
+            finally:
+                self.scheduler.release(resp)
+        if content:
+            try:
+                content = decode_json(content, resp)
+            except JSONDecodeError:
+                if resp.get('status') == '200':
+                    raise
+            else:
+                if self.user_cache is not None and \
+                                            resp.get('status') == '200':
+                    content = self.user_cache.absorb(content)
+        
         return resp, content
     
     #####################
@@ -265,12 +896,7 @@ class Client(object):
             resp, search_results = twitter.search('beer')
           
         """
-        params = kwargs
-        if q:
-            params['q'] = q
-        
-        return self.request(self.base_search_url+'/search.json?%s' %
-                             urlencode(params), "GET")
+        return self._call('search', q=q, **kwargs)
     
     def trends(self):
         """
@@ -287,7 +913,7 @@ class Client(object):
             resp, trending = twitter.trends()
           
         """
-        return self.request(self.base_search_url+'/trends.json', "GET")
+        return self._call('trends')
     
     def trends_current(self, exclude=None):
         """
@@ -307,10 +933,7 @@ class Client(object):
             resp, trending = twitter.trends_current(exclude='hashtags')
           
         """
-        params = get_params_dict(exclude=exclude)
-            
-        return self.request(self.base_search_url+'/trends/current.json?%s' %
-                             urlencode(params), "GET")
+        return self._call('trends_current', exclude=exclude)
     
     def trends_daily(self, date=None, exclude=None):
         """
@@ -331,10 +954,7 @@ class Client(object):
         """
         if isinstance(date, datetype):
             date = date.strftime('%Y-%m-%d')
-        params = get_params_dict(date=date, exclude=exclude)
-            
-        return self.request(self.base_search_url+'/trends/daily.json?%s' %
-                             urlencode(params), "GET")
+        return self._call('trends_daily', date=date, exclude=exclude)
     
     def trends_weekly(self, date=None, exclude=None):
         """
@@ -356,10 +976,7 @@ class Client(object):
         """
         if isinstance(date, datetype):
             date = date.strftime('%Y-%m-%d')
-        params = get_params_dict(date=date, exclude=exclude)
-            
-        return self.request(self.base_search_url+'/trends/weekly.json?%s' %
-                             urlencode(params), "GET")
+        return self._call('trends_weekly', date=date, exclude=exclude)
     
     ###################
     # Timeline Methods
@@ -371,11 +988,8 @@ class Client(object):
         Returns the most recent statuses, including retweets, posted by the
         authenticating user and that user's friends.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/home_timeline.json?%s' % urlencode(params), "GET")
+        return self._call('statuses_home_timeline', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def statuses_friends_timeline(self, since_id=None, max_id=None, count=None,
                                page=None):
@@ -386,12 +1000,8 @@ class Client(object):
         Note: Retweets will not appear in the friends_timeline for backwards
         compatibility. If you want retweets included use home_timeline.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/friends_timeline.json?%s' % urlencode(params),
-                "GET")
+        return self._call('statuses_friends_timeline', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def statuses_user_timeline(self, user_id=None, screen_name=None,
                         since_id=None, max_id=None, count=None, page=None):
@@ -400,11 +1010,9 @@ class Client(object):
         It's also possible to request another user's timeline via the user_id
         or screen_name parameter.
         """
-        params = get_params_dict(user_id=user_id, screen_name=screen_name,
-                    since_id=since_id, max_id=max_id, count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/user_timeline.json?%s' % urlencode(params), "GET")
+        return self._call('statuses_user_timeline', user_id=user_id,
+                          screen_name=screen_name, since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def statuses_mentions(self, since_id=None, max_id=None, count=None,
                                page=None):
@@ -412,22 +1020,16 @@ class Client(object):
         Returns the most recent mentions (status containing @username) for
         the authenticating user.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/mentions.json?%s' % urlencode(params), "GET")
+        return self._call('statuses_mentions', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def statuses_retweeted_by_me(self, since_id=None, max_id=None, count=None,
                                page=None):
         """
         Returns the most recent retweets posted by the authenticating user.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/retweeted_by_me.json?%s' % urlencode(params), "GET")
+        return self._call('statuses_retweeted_by_me', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def statuses_retweeted_to_me(self, since_id=None, max_id=None, count=None,
                                page=None):
@@ -435,11 +1037,8 @@ class Client(object):
         Returns the most recent retweets posted by the authenticating user's
         friends.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/retweeted_to_me.json?%s' % urlencode(params), "GET")
+        return self._call('statuses_retweeted_to_me', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def statuses_retweeted_of_me(self, since_id=None, max_id=None, count=None,
                                page=None):
@@ -447,11 +1046,8 @@ class Client(object):
         Returns the most recent tweets of the authenticated user that have
         been retweeted by others.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+
-                '/statuses/retweeted_of_me.json?%s' % urlencode(params), "GET")
+        return self._call('statuses_retweeted_of_me', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     #################
     # Status Methods
@@ -462,8 +1058,7 @@ class Client(object):
         Returns a single status, specified by the id parameter.  The status's
         author will be returned inline.
         """
-        return self.request(self.base_api_url+
-                '/statuses/show/%s.format' % id, "GET")
+        return self._call('statuses_show', id=id)
     
     
     
@@ -475,38 +1070,30 @@ class Client(object):
         Note: A status update with text identical to the authenticating
         user's current status will be ignored to prevent duplicates.
         """
-        params = get_params_dict(status=status,
-                                 in_reply_to_status_id=in_reply_to_status_id,
-                                 lat=lat, long=long, place_id=place_id,
-                                 display_coordinates=display_coordinates)
-            
-        return self.request(self.base_api_url+'/statuses/update.json', "POST",
-                             urlencode(params))
+        return self._call('statuses_update', status=status,
+                          in_reply_to_status_id=in_reply_to_status_id, lat=lat,
+                          long=long, place_id=place_id,
+                          display_coordinates=display_coordinates)
     
     def statuses_destroy(self, id):
         """
         Destroys the status specified by the required ID parameter.  The
         authenticating user must be the author of the specified status.
         """ 
-        return self.request(self.base_api_url+'/statuses/destroy/%s.json' % id,
-                            "POST")
+        return self._call('statuses_destroy', id=id)
     
     def statuses_retweet(self, id):
         """
         Retweets a tweet. Requires the id parameter of the tweet you are
         Returns the original tweet with retweet details embedded.
         """ 
-        return self.request(self.base_api_url+'/statuses/retweet/%s.json' % id,
-                            "POST")
+        return self._call('statuses_retweet', id=id)
     
     def statuses_retweets(self, id, count=None):
         """
         Returns up to 100 of the first retweets of a given tweet.
         """ 
-        params = get_params_dict(count=count)
-        
-        return self.request(self.base_api_url+'/statuses/retweets/%s.json?%s' %
-                            (id, urlencode(params)), "GET")
+        return self._call('statuses_retweets', id=id, count=count)
     
     ###############
     # User Methods
@@ -524,10 +1111,8 @@ class Client(object):
         if user_id and screen_name:
             raise Exception("A user_id OR screen_name must be provided.")
         
-        params = get_params_dict(user_id=user_id, screen_name=screen_name)
-        
-        return self.request(self.base_api_url+'/users/show.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('users_show', user_id=user_id,
+                          screen_name=screen_name)
     
     def users_lookup(self, user_id=None, screen_name=None):
         """
@@ -536,16 +1121,14 @@ class Client(object):
         recent status (if the authenticating user has permission) will be
         returned inline.
         """
-        if user_id and not isinstance(user_id, str) and \
-                                            not isinstance(user_id, int):
-            user_id = ",".join(user_id)
-        if screen_name and not isinstance(screen_name, str):
+        if user_id and not isinstance(user_id, basestring) and \
+                                    not isinstance(user_id, (int, long)):
+            user_id = ",".join([str(id) for id in user_id])
+        if screen_name and not isinstance(screen_name, basestring):
             screen_name = ",".join(screen_name)
         
-        params = get_params_dict(user_id=user_id, screen_name=screen_name)
-        
-        return self.request(self.base_api_url+'/users/lookup.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('users_lookup', user_id=user_id,
+                          screen_name=screen_name)
     
     def users_search(self, q, per_page=None, page=None):
         """
@@ -554,10 +1137,7 @@ class Client(object):
         returned by using this API (about being listed in the People Search).
         It is only possible to retrieve the first 1000 matches from this API.
         """
-        params = get_params_dict(q=q, per_page=per_page, page=page)
-        
-        return self.request(self.base_api_url+'/users/search.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('users_search', q=q, per_page=per_page, page=page)
     
     def users_suggestions(self):
         """
@@ -565,15 +1145,14 @@ class Client(object):
         suggested user categories.  The category can be used in the
         users_suggestions_category method to get the users in that category.
         """
-        return self.request(self.base_api_url+'/users/suggestions.json', "GET")
+        return self._call('users_suggestions')
     
     def users_suggestions_category(self, slug):
         """
         Access the users in a given category of the Twitter suggested user
         list.
         """
-        return self.request(self.base_api_url+'/users/suggestions/%s.json' %
-                            slug, "GET")
+        return self._call('users_suggestions_category', slug=slug)
     
     def statuses_friends(self, user_id=None, screen_name=None, cursor=None):
         """
@@ -586,11 +1165,8 @@ class Client(object):
         possible to request another user's friends list via the id,
         screen_name or user_id parameter.
         """
-        params = get_params_dict(user_id=user_id, screen_name=screen_name,
-                                 cursor=cursor)
-        
-        return self.request(self.base_api_url+'/statuses/friends.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('statuses_friends', user_id=user_id,
+                          screen_name=screen_name, cursor=cursor)
     
     def statuses_followers(self, user_id=None, screen_name=None, cursor=None):
         """
@@ -600,11 +1176,8 @@ class Client(object):
         
         Use the cursor option to access earlier followers.
         """
-        params = get_params_dict(user_id=user_id, screen_name=screen_name,
-                                 cursor=cursor)
-        
-        return self.request(self.base_api_url+'/statuses/followers.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('statuses_followers', user_id=user_id,
+                          screen_name=screen_name, cursor=cursor)
     
     ###############
     # List Methods
@@ -616,21 +1189,15 @@ class Client(object):
         
         Accounts are limited to 20 lists.
         """
-        params = get_params_dict(name=name, mode=mode,
-                                 description=description)
-        
-        return self.request(self.base_api_url+'/%s/lists.json' % user,
-                            "POST", urlencode(params))
+        return self._call('create_list', user=user, name=name, mode=mode,
+                          description=description)
     
     def update_list(self, user, id, name=None, mode=None, description=None):
         """
         Updates the specified list.
         """
-        params = get_params_dict(name=name, mode=mode,
-                                 description=description)
-        
-        return self.request(self.base_api_url+'/%s/lists/%s.json' %
-                            (user, id), "POST", urlencode(params))
+        return self._call('update_list', user=user, id=id, name=name,
+                          mode=mode, description=description)
     
     def get_lists(self, user, cursor=None):
         """
@@ -639,10 +1206,7 @@ class Client(object):
         Private lists will be included if the authenticated users is the same
         as the user who'se lists are being returned.
         """
-        params = get_params_dict(cursor=cursor)
-        
-        return self.request(self.base_api_url+'/%s/lists.json?%s' %
-                            (user, urlencode(params)), "GET")
+        return self._call('get_lists', user=user, cursor=cursor)
     
     def get_list(self, user, id):
         """
@@ -651,47 +1215,34 @@ class Client(object):
         Private lists will only be shown if the authenticated user owns the
         specified list.
         """
-        return self.request(self.base_api_url+'/%s/lists/%s.json' %
-                            (user, id), "GET")
+        return self._call('get_list', user=user, id=id)
     
     def delete_list(self, user, id):
         """
         Deletes the specified list. Must be owned by the authenticated user.
         """
-        return self.request(self.base_api_url+'/%s/lists/%s.json' %
-                            (user, id), "DELETE")
+        return self._call('delete_list', user=user, id=id)
     
     def get_list_statuses(self, user, list_id, since_id=None, max_id=None,
                           per_page=None, page=None):
         """
         Show tweet timeline for members of the specified list.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 per_page=per_page, page=page)
-        
-        return self.request(self.base_api_url+
-                            '/%s/lists/%s/statuses.json' %
-                            (user, list_id), "GET")
+        return self._call('get_list_statuses', user=user, list_id=list_id,
+                          since_id=since_id, max_id=max_id, per_page=per_page,
+                          page=page)
     
     def get_list_memberships(self, user, cursor=None):
         """
         List the lists the specified user has been added to.
         """
-        params = get_params_dict(cursor=cursor)
-        
-        return self.request(self.base_api_url+
-                            '/%s/lists/memberships.json?%s' %
-                            (user, urlencode(params)), "GET")
+        return self._call('get_list_memberships', user=user, cursor=cursor)
     
     def get_list_subscriptions(self, user, cursor=None):
         """
         List the lists the specified user follows.
         """
-        params = get_params_dict(cursor=cursor)
-        
-        return self.request(self.base_api_url+
-                            '/%s/lists/subscriptions.json?%s' %
-                            (user, urlencode(params)), "GET")
+        return self._call('get_list_subscriptions', user=user, cursor=cursor)
     
     #######################
     # List Members Methods
@@ -701,11 +1252,8 @@ class Client(object):
         """
         Returns the members of the specified list.
         """
-        params = get_params_dict(cursor=cursor)
-        
-        return self.request(self.base_api_url+
-                            '/%s/%s/members.json?%s' %
-                            (user, list_id, urlencode(params)), "GET")
+        return self._call('get_list_members', user=user, list_id=list_id,
+                          cursor=cursor)
     
     def add_list_member(self, user, list_id, id):
         """
@@ -716,10 +1264,7 @@ class Client(object):
         The authenticated user must own the list to be able to add members to
         it. Lists are limited to having 500 members.
         """
-        params = get_params_dict(id=id)
-        
-        return self.request(self.base_api_url+'/%s/%s/members.json' %
-                            (user, list_id), "POST", urlencode(params))
+        return self._call('add_list_member', user=user, list_id=list_id, id=id)
     
     def delete_list_member(self, user, list_id, id):
         """
@@ -730,10 +1275,8 @@ class Client(object):
         The authenticated user must be the list's owner to remove members
         from the list.
         """
-        params = get_params_dict(id=id)
-        
-        return self.request(self.base_api_url+'/%s/%s/members.json?%s' %
-                            (user, list_id, urlencode(params)), "DELETE")
+        return self._call('delete_list_member', user=user, list_id=list_id,
+                          id=id)
     
     def get_list_members_id(self, user, list_id, id):
         """
@@ -742,8 +1285,8 @@ class Client(object):
         id is the user_id or screen_name of the user who you want to know
         is a member or not of the specified list.
         """
-        return self.request(self.base_api_url+ '/%s/%s/members/%s.json' %
-                            (user, list_id, id), "GET")
+        return self._call('get_list_members_id', user=user, list_id=list_id,
+                          id=id)
     
     ###########################
     # List Subscribers Methods
@@ -753,25 +1296,20 @@ class Client(object):
         """
         Returns the subscribers of the specified list.
         """
-        params = get_params_dict(cursor=cursor)
-        
-        return self.request(self.base_api_url+
-                            '/%s/%s/subscribers.json?%s' %
-                            (user, list_id, urlencode(params)), "GET")
+        return self._call('get_list_subscribers', user=user, list_id=list_id,
+                          cursor=cursor)
     
     def subscribe_to_list(self, user, list_id):
         """
         Make the authenticated user follow the specified list.
         """
-        return self.request(self.base_api_url+'/%s/%s/subscribers.json' %
-                            (user, list_id), "POST")
+        return self._call('subscribe_to_list', user=user, list_id=list_id)
     
     def unsubscribe_from_list(self, user, list_id):
         """
         Unsubscribes the authenticated user form the specified list.
         """
-        return self.request(self.base_api_url+'/%s/%s/subscribers.json' %
-                            (user, list_id), "DELETE")
+        return self._call('unsubscribe_from_list', user=user, list_id=list_id)
     
     def get_list_subscribers_id(self, user, list_id, id):
         """
@@ -780,8 +1318,8 @@ class Client(object):
         id is the user_id or screen_name of the user who you want to know
         is a subscriber or not of the specified list.
         """
-        return self.request(self.base_api_url+ '/%s/%s/subscribers/%s.json' %
-                            (user, list_id, id), "GET")
+        return self._call('get_list_subscribers_id', user=user,
+                          list_id=list_id, id=id)
     
     #########################
     # Direct Message Methods
@@ -794,10 +1332,8 @@ class Client(object):
         authenticating user. Includes detailed information about the
         sending and recipient users.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+'/direct_messages.json', "GET")
+        return self._call('direct_messages', since_id=since_id, max_id=max_id,
+                          count=count, page=page)
     
     def direct_messages_sent(self, since_id=None, max_id=None, count=None,
                                page=None):
@@ -806,11 +1342,8 @@ class Client(object):
         authenticating user. Includes detailed information about the
         sending and recipient users.
         """
-        params = get_params_dict(since_id=since_id, max_id=max_id,
-                                 count=count, page=page)
-        
-        return self.request(self.base_api_url+'/direct_messages/sent.json',
-                            "GET")
+        return self._call('direct_messages_sent', since_id=since_id,
+                          max_id=max_id, count=count, page=page)
     
     def direct_messages_new(self, user, text):
         """
@@ -819,10 +1352,7 @@ class Client(object):
         
         Returns the sent message in the requested format when successful.
         """
-        params = get_params_dict(user=user, text=text)
-        
-        return self.request(self.base_api_url+'/direct_messages/new.json',
-                            "POST", urlencode(params))
+        return self._call('direct_messages_new', user=user, text=text)
     
     def direct_messages_destroy(self, id):
         """
@@ -831,8 +1361,7 @@ class Client(object):
         The authenticating user must be the recipient of the specified
         direct message.
         """
-        return self.request(self.base_api_url+
-                            '/direct_messages/destroy/%s.json' % id, "DELETE")
+        return self._call('direct_messages_destroy', id=id)
     
     
     #####################
@@ -858,11 +1387,8 @@ class Client(object):
         
         if follow:
             follow = 'true'
-        params = get_params_dict(user_id=user_id, screen_name=screen_name,
-                                 follow=follow)
-        
-        return self.request(self.base_api_url+'/friendships/create.json',
-                            "POST", urlencode(params))
+        return self._call('friendships_create', user_id=user_id,
+                          screen_name=screen_name, follow=follow)
 
     def friendships_destroy(self, user_id=None, screen_name=None):
         """
@@ -877,10 +1403,8 @@ class Client(object):
         if user_id and screen_name:
             raise Exception("A user_id OR screen_name must be provided.")
         
-        params = get_params_dict(user_id=user_id, screen_name=screen_name)
-        
-        return self.request(self.base_api_url+'/friendships/destroy.json',
-                            "POST", urlencode(params))
+        return self._call('friendships_destroy', user_id=user_id,
+                          screen_name=screen_name)
     
     def friendships_exists(self, user_a, user_b):
         """
@@ -889,10 +1413,7 @@ class Client(object):
         
         user_a and user_b can be the user_id or screen_name of the users.
         """
-        params = get_params_dict(user_a=user_a, user_b=user_b)
-        
-        return self.request(self.base_api_url+'/friendships/exists.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('friendships_exists', user_a=user_a, user_b=user_b)
     
     #######################
     # Social Graph Methods
@@ -908,11 +1429,8 @@ class Client(object):
         if user_id and screen_name:
             raise Exception("A user_id OR screen_name must be provided.")
         
-        params = get_params_dict(user_id=user_id, screen_name=screen_name,
-                                 cursor=cursor)
-        
-        return self.request(self.base_api_url+'/friends/ids.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('friends_ids', user_id=user_id,
+                          screen_name=screen_name, cursor=cursor)
     
     def followers_ids(self, user_id=None, screen_name=None, cursor=None):
         """
@@ -925,11 +1443,8 @@ class Client(object):
         if user_id and screen_name:
             raise Exception("A user_id OR screen_name must be provided.")
         
-        params = get_params_dict(user_id=user_id, screen_name=screen_name,
-                                 cursor=cursor)
-        
-        return self.request(self.base_api_url+'/followers/ids.json?%s' %
-                            urlencode(params), "GET")
+        return self._call('followers_ids', user_id=user_id,
+                          screen_name=screen_name, cursor=cursor)
         
     ##################
     # Account Methods
@@ -942,8 +1457,7 @@ class Client(object):
         requesting user if authentication was successful; returns a 401
         status code and an error message if not.
         """
-        return self.request(self.base_api_url+
-                            '/account/verify_credentials.json', "GET")
+        return self._call('verify_credentials')
 
     def rate_limit_status(self):
         """
@@ -954,21 +1468,163 @@ class Client(object):
         the authenticating user is returned.  Otherwise, the rate limit status
         for the requester's IP address is returned.
         """
-        return self.request(self.base_api_url+
-                            '/account/rate_limit_status.json', "GET")
+        return self._call('rate_limit_status')
+
+
+class LRUCache(object):
+    """
+    A dict-like cache that keeps at most `max_size` entries, evicting the
+    least recently used ones. It counts hits and misses of get().
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.data = {}
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key, default=None):
+        entry = self.data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.clock += 1
+        entry[0] = self.clock
+        return entry[1]
+    
+    def peek(self, key, default=None):
+        """
+        Returns a value without counting a hit or miss or touching its
+        position.
+        """
+        entry = self.data.get(key)
+        if entry is None:
+            return default
+        return entry[1]
+    
+    def __contains__(self, key):
+        return key in self.data
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def __setitem__(self, key, value):
+        self.clock += 1
+        self.data[key] = [self.clock, value]
+        if len(self.data) > self.max_size:
+            self._evict()
+    
+    def __delitem__(self, key):
+        del self.data[key]
+    
+    def pop(self, key, default=None):
+        entry = self.data.pop(key, None)
+        if entry is None:
+            return default
+        return entry[1]
+    
+    def items(self):
+        return [(key, entry[1]) for key, entry in self.data.items()]
+    
+    def _evict(self):
+        # Evict the oldest quarter at once, so eviction is amortized O(1)
+        # per insert instead of a scan on every insert past max_size.
+        keep = self.max_size - max(1, self.max_size // 4)
+        entries = sorted(self.data.items(), key=lambda item: item[1][0])
+        for key, entry in entries[:len(entries) - keep]:
+            del self.data[key]
+    
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if not total:
+            return 0.0
+        return float(self.hits) / total
+
+
+def cursor_pages(method, *args, **kwargs):
+    """
+    Utility generator that follows next_cursor across the pages of a
+    cursored method (friends_ids, followers_ids, statuses_friends, ...),
+    yielding each (resp, content) pair.
+    
+    Stops at the last page or at the first non-200 response (which is
+    yielded so the caller can inspect it).
+    """
+    cursor = kwargs.pop('cursor', -1)
+    while True:
+        resp, content = method(cursor=cursor, *args, **kwargs)
+        yield resp, content
+        if resp.get('status') != '200' or not isinstance(content, dict):
+            return
+        cursor = content.get('next_cursor', 0)
+        if not cursor:
+            return
+
+
+def concurrent_map(function, items, threads=10):
+    """
+    Utility function that calls `function` on each item over a pool of
+    threads, returning a list of (item, result, exception) in completion
+    order.
+    """
+    import threading
+    from Queue import Queue
+    
+    items = list(items)
+    jobs = Queue()
+    results = Queue()
+    for item in items:
+        jobs.put(item)
+    
+    def worker():
+        while True:
+            try:
+                item = jobs.get_nowait()
+            except Exception:
+                return
+            try:
+                results.put((item, function(item), None))
+            except Exception, e:
+                results.put((item, None, e))
+    
+    workers = []
+    for i in range(min(threads, len(items))):
+        thread = threading.Thread(target=worker)
+        thread.setDaemon(True)
+        thread.start()
+        workers.append(thread)
+    done = [results.get() for item in items]
+    for thread in workers:
+        thread.join()
+    return done
 
 
-def get_params_dict(**kwargs):
+def iter_results(content):
     """
-    Utility function that returns a dict with the set parameters (not None)
+    Utility function that yields the items of a decoded response, whether
+    it is a plain list (timelines, lists, direct messages), a search
+    response ('results') or a cursored page ('ids', 'users', 'lists').
     """
-    for key in kwargs.keys():
-        if kwargs[key] == None:
-            del kwargs[key]
-    return kwargs
+    if isinstance(content, list):
+        items = content
+    elif isinstance(content, dict):
+        items = []
+        for key in ('results', 'ids', 'users', 'lists'):
+            if key in content:
+                items = content[key]
+                break
+    else:
+        items = []
+    for item in items:
+        yield item
 
 
-__all__ = ["OAuth", "BasicAuth", "Client"]
+__all__ = ["OAuth", "BasicAuth", "Client", "RequestScheduler",
+           "RequestExpired", "PRIORITY_HIGH", "PRIORITY_NORMAL",
+           "PRIORITY_LOW", "JSONDecodeError", "set_json_backend",
+           "decode_json", "ENDPOINTS", "Hedger", "LRUCache",
+           "concurrent_map", "cursor_pages", "iter_results"]
 
 
 
@@ -0,0 +1,131 @@
+"""
+Conversation thread reconstruction.
+
+Rebuilds reply threads by following in_reply_to_status_id breadth-first:
+each round fetches the missing parents of every thread at once, over a pool
+of threads, so expanding many threads costs about as many rounds as the
+longest thread is deep rather than one request per hop.
+
+Example::
+
+    from twitapi import iter_results
+    from twitapi.conversations import expand_threads
+
+    resp, mentions = twitter.statuses_mentions(count=200)
+    cache = {}
+    for root in expand_threads(twitter, iter_results(mentions), cache):
+        print root.status['text'], len(root.children)
+
+Statuses already in `cache` (a dict of status id to status) are never
+fetched again, and fetched ones are added to it.
+"""
+
+from twitapi import concurrent_map
+
+
+class ConversationNode(object):
+    """
+    A status in a conversation tree, with the replies to it as children.
+    """
+    def __init__(self, status):
+        self.status = status
+        self.children = []
+
+    def walk(self):
+        """
+        Yields the statuses of the tree, depth first.
+        """
+        yield self.status
+        for child in self.children:
+            for status in child.walk():
+                yield status
+
+
+def parent_id(status):
+    return status.get('in_reply_to_status_id')
+
+
+def first_uncached(id, cache):
+    """
+    Follows the parents of `id` through `cache` and returns the first
+    ancestor that isn't cached, or None if the conversation is complete.
+    """
+    seen = set()
+    while id and id in cache and id not in seen:
+        seen.add(id)
+        id = parent_id(cache[id])
+    if id in seen:
+        return None
+    return id
+
+
+def fetch_statuses(client, ids, threads=10):
+    """
+    Fetch statuses by id concurrently with statuses_show. Returns a dict of
+    id to status, leaving out the ones that couldn't be fetched (deleted,
+    protected, ...).
+    """
+    def show(id):
+        return client.statuses_show(id)
+
+    statuses = {}
+    for id, result, error in concurrent_map(show, ids, threads):
+        if error is None and result[0]['status'] == '200':
+            statuses[id] = result[1]
+    return statuses
+
+
+def expand_threads(client, statuses, cache=None, threads=10, max_rounds=None):
+    """
+    Fetch the ancestors of `statuses` and return the conversation trees
+    they belong to, as a list of root ConversationNodes.
+
+    A root is the first status of a conversation that could be fetched, so
+    it may itself be a reply to a deleted or protected status.
+    """
+    if cache is None:
+        cache = {}
+    statuses = list(statuses)
+    for status in statuses:
+        cache[status['id']] = status
+
+    unavailable = set()
+    frontier = set([first_uncached(s['id'], cache) for s in statuses])
+    rounds = 0
+    while True:
+        missing = [id for id in frontier if id and id not in unavailable]
+        if not missing or (max_rounds is not None and rounds >= max_rounds):
+            break
+        fetched = fetch_statuses(client, missing, threads)
+        unavailable.update([id for id in missing if id not in fetched])
+        cache.update(fetched)
+        # step through the ancestors that are already cached
+        frontier = set([first_uncached(id, cache) for id in fetched])
+        rounds += 1
+
+    nodes = {}
+    roots = []
+    for status in statuses:
+        # walk up from each status, linking nodes until reaching a known
+        # node or the top of the conversation
+        child = None
+        id = status['id']
+        while id in cache:
+            if id in nodes:
+                if child is not None:
+                    nodes[id].children.append(child)
+                break
+            node = nodes[id] = ConversationNode(cache[id])
+            if child is not None:
+                node.children.append(child)
+            child = node
+            id = parent_id(node.status)
+            if id not in cache:
+                roots.append(node)
+
+    for node in nodes.values():
+        node.children.sort(key=lambda n: n.status['id'])
+    return roots
+
+
+__all__ = ["ConversationNode", "expand_threads", "fetch_statuses"]
@@ -0,0 +1,470 @@
+"""
+Multi-process crawler for the paginated Twitter API methods.
+
+The crawl is split into jobs (one user for followers_ids, friends_ids and
+statuses_user_timeline, one chunk of up to 100 ids for users_lookup) that
+are handed out to worker processes. The workers share a rate limit budget
+and a credential health flag through shared memory, and each job checkpoints
+its progress to a local directory. When a worker dies in the middle of a job
+it is replaced and the job is handed out again, resuming from its checkpoint;
+an interrupted crawl likewise picks up where it left off when run again.
+
+Example::
+
+    from twitapi import Client, OAuth
+    from twitapi.crawler import Crawler
+
+    def make_client():
+        return Client(OAuth(CONSUMER_KEY, CONSUMER_SECRET, TOKEN, SECRET))
+
+    crawler = Crawler(make_client, '/var/tmp/crawl', processes=4)
+    followers = crawler.crawl('followers_ids', [12, 13, 14])
+
+The client factory is called once in each worker, so it must be picklable
+(a module level function).
+"""
+
+import os
+import time
+import multiprocessing
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5 # python 2.4
+try:
+    import json # python 2.6
+except ImportError:
+    import simplejson as json # python 2.4 to 2.5
+
+from twitapi import iter_results
+
+# How each supported method is paginated.
+CURSOR = 'cursor'
+MAX_ID = 'max_id'
+SINGLE = 'single'
+
+PAGINATION = {
+    'followers_ids': CURSOR,
+    'friends_ids': CURSOR,
+    'statuses_friends': CURSOR,
+    'statuses_followers': CURSOR,
+    'statuses_user_timeline': MAX_ID,
+    'users_lookup': SINGLE,
+}
+
+USERS_LOOKUP_CHUNK = 100
+
+
+class CrawlError(Exception):
+    """
+    Raised when a crawl cannot continue, e.g. the credentials were revoked.
+    """
+
+
+class RateBudget(object):
+    """
+    A rate limit budget shared by every process of a crawl.
+
+    The budget is refreshed from the X-RateLimit-* headers of each response,
+    so the workers never spend more than what the API reports as remaining.
+    `reserve` requests are always left untouched for other uses of the same
+    credentials.
+    """
+    def __init__(self, remaining=150, reserve=0):
+        self.remaining = multiprocessing.Value('l', remaining)
+        self.reset = multiprocessing.Value('d', 0.0)
+        self.revoked = multiprocessing.Value('b', 0)
+        self.reserve = reserve
+
+    def acquire(self):
+        """
+        Take one request from the budget, sleeping until the rate limit
+        window resets if it has been used up.
+        """
+        while True:
+            if self.revoked.value:
+                raise CrawlError("The crawl credentials were rejected.")
+            self.remaining.get_lock().acquire()
+            try:
+                if self.remaining.value > self.reserve:
+                    self.remaining.value -= 1
+                    return
+                wait = self.reset.value - time.time()
+                if wait <= 0:
+                    # unknown reset time, or it has already passed: the next
+                    # response will tell us the real numbers.
+                    self.remaining.value = self.reserve
+                    return
+            finally:
+                self.remaining.get_lock().release()
+            time.sleep(min(wait, 60))
+
+    def revoke(self):
+        """
+        Flag the crawl credentials as rejected, stopping every worker.
+        """
+        self.revoked.value = 1
+
+    def update(self, resp):
+        """
+        Update the budget from the rate limit headers of a response.
+        """
+        remaining = resp.get('x-ratelimit-remaining')
+        reset = resp.get('x-ratelimit-reset')
+        self.remaining.get_lock().acquire()
+        try:
+            if remaining is not None:
+                self.remaining.value = int(remaining)
+            if reset is not None:
+                self.reset.value = float(reset)
+        finally:
+            self.remaining.get_lock().release()
+
+
+class CheckpointStore(object):
+    """
+    Keeps the progress of each crawl job in a local directory.
+
+    Every job has an append-only items file, one json item per line, and a
+    small checkpoint file with the pagination position and the number of
+    items that belong to completed pages. The checkpoint is replaced
+    atomically after the items are on disk, so items from a page that was
+    being written when a worker died are ignored on resume.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, job_id, ext):
+        return os.path.join(self.directory, '%s.%s' % (job_id, ext))
+
+    def load(self, job_id):
+        """
+        Returns the (position, count, done) checkpoint of a job, or None.
+        """
+        try:
+            f = open(self._path(job_id, 'ckpt'))
+        except IOError:
+            return None
+        try:
+            return json.loads(f.read())
+        finally:
+            f.close()
+
+    def save(self, job_id, position, count, done=False):
+        path = self._path(job_id, 'ckpt')
+        f = open(path + '.tmp', 'w')
+        try:
+            f.write(json.dumps({'position': position, 'count': count,
+                                'done': done}))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(path + '.tmp', path)
+
+    def append(self, job_id, items):
+        f = open(self._path(job_id, 'items'), 'a')
+        try:
+            for item in items:
+                f.write(json.dumps(item) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+
+    def truncate(self, job_id, count):
+        """
+        Drop any items past the first `count` (left over by a crash).
+        """
+        path = self._path(job_id, 'items')
+        if not os.path.exists(path):
+            return
+        f = open(path, 'r+')
+        try:
+            offset = 0
+            for i in range(count):
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+            f.truncate(offset)
+        finally:
+            f.close()
+
+    def items(self, job_id):
+        path = self._path(job_id, 'items')
+        if not os.path.exists(path):
+            return []
+        f = open(path)
+        try:
+            return [json.loads(line) for line in f]
+        finally:
+            f.close()
+
+
+def _worker_loop(conn, client_factory, budget, directory):
+    # Runs the jobs sent by the crawl process until it sends None.
+    client = client_factory()
+    store = CheckpointStore(directory)
+    while True:
+        job = conn.recv()
+        if job is None:
+            break
+        try:
+            result = (True, run_job(client, budget, store, *job))
+        except Exception, e:
+            result = (False, e)
+        conn.send(result)
+
+
+class WorkerProcess(object):
+    """
+    A crawl worker process and the pipe its jobs go through.
+    """
+    def __init__(self, client_factory, budget, directory):
+        self.conn, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_loop,
+                            args=(child, client_factory, budget, directory))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.job = None
+
+    def send(self, index, job):
+        self.job = index
+        self.conn.send(job)
+
+    def result(self):
+        """
+        Returns the (ok, value) result of the current job, None if it is
+        still running, or raises EOFError if the process died.
+        """
+        if not self.conn.poll():
+            if self.process.is_alive():
+                return None
+            # it may have answered just before exiting
+            if not self.conn.poll():
+                raise EOFError
+        result = self.conn.recv()
+        self.job = None
+        return result
+
+    def stop(self):
+        try:
+            if self.job is None and self.process.is_alive():
+                self.conn.send(None)
+                self.process.join(1)
+        except (IOError, OSError):
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.conn.close()
+
+
+def job_id_for(method_name, key):
+    """
+    Returns a file name safe id for a crawl job.
+    """
+    if isinstance(key, (list, tuple)):
+        key = md5(','.join([str(k) for k in key])).hexdigest()
+    return '%s-%s' % (method_name, str(key).replace(os.sep, '_'))
+
+
+def run_job(client, budget, store, method_name, key, kwargs):
+    """
+    Crawl every page of one job, resuming from its checkpoint.
+
+    Returns the job key together with the number of items crawled.
+    """
+    job_id = job_id_for(method_name, key)
+    checkpoint = store.load(job_id)
+    if checkpoint and checkpoint['done']:
+        return key, checkpoint['count']
+    if checkpoint:
+        position, count = checkpoint['position'], checkpoint['count']
+        store.truncate(job_id, count)
+    else:
+        position, count = None, 0
+        store.truncate(job_id, 0)
+
+    method = getattr(client, method_name)
+    pagination = PAGINATION[method_name]
+    params = dict(kwargs)
+    if pagination == SINGLE:
+        if isinstance(key[0], (int, long)):
+            params['user_id'] = ','.join([str(k) for k in key])
+        else:
+            params['screen_name'] = ','.join(key)
+    elif isinstance(key, (int, long)):
+        params['user_id'] = key
+    else:
+        params['screen_name'] = key
+
+    while True:
+        if pagination == CURSOR:
+            params['cursor'] = position or -1
+        elif pagination == MAX_ID and position:
+            params['max_id'] = position
+
+        budget.acquire()
+        resp, content = method(**params)
+        budget.update(resp)
+        if resp.get('status') == '401':
+            # Protected accounts also answer 401, so only give up on the
+            # whole crawl if the credentials themselves are rejected.
+            budget.acquire()
+            check, content = client.verify_credentials()
+            budget.update(check)
+            if check.get('status') == '401':
+                budget.revoke()
+                raise CrawlError("The crawl credentials were rejected.")
+        if resp.get('status') != '200':
+            # Leave the checkpoint in place so the job is retried next time.
+            return key, None
+
+        items = list(iter_results(content))
+        store.append(job_id, items)
+        count += len(items)
+
+        if pagination == CURSOR:
+            position = content.get('next_cursor', 0)
+            done = not position
+        elif pagination == MAX_ID:
+            done = not items
+            if items:
+                position = items[-1]['id'] - 1
+        else:
+            done = True
+        store.save(job_id, position, count, done)
+        if done:
+            return key, count
+
+
+class Crawler(object):
+    """
+    Crawls a paginated method for many users over a pool of processes.
+
+    The results of every job are kept in `directory` and crawling the same
+    keys again only fetches what is missing. A job whose worker process dies
+    is resumed by a new worker, up to `max_restarts` times.
+    """
+    def __init__(self, client_factory, directory, processes=None,
+                 budget=None, max_restarts=3):
+        self.client_factory = client_factory
+        self.directory = directory
+        self.processes = processes
+        self.max_restarts = max_restarts
+        if budget is None:
+            budget = RateBudget()
+        self.budget = budget
+        self.store = CheckpointStore(directory)
+
+    def jobs(self, method_name, keys, **kwargs):
+        if method_name not in PAGINATION:
+            raise Exception("%s can't be crawled." % method_name)
+        keys = list(keys)
+        if PAGINATION[method_name] == SINGLE:
+            keys = [tuple(keys[i:i + USERS_LOOKUP_CHUNK])
+                    for i in range(0, len(keys), USERS_LOOKUP_CHUNK)]
+        return [(method_name, key, kwargs) for key in keys]
+
+    def crawl(self, method_name, keys, **kwargs):
+        """
+        Crawl `method_name` for each of `keys` (user ids or screen names)
+        and return a dict of key to the list of crawled items. For
+        users_lookup the list holds the one user returned for the key
+        (keys of users that weren't returned are left out).
+
+        Jobs that could not be finished are left out of the result and
+        will be resumed by the next crawl.
+        """
+        jobs = self.jobs(method_name, keys, **kwargs)
+        finished = self.run_jobs(jobs)
+
+        results = {}
+        for key, count in finished:
+            if count is None:
+                continue
+            items = self.store.items(job_id_for(method_name, key))
+            if PAGINATION[method_name] == SINGLE:
+                results.update(self._users_by_key(key, items))
+            else:
+                results[key] = items
+        return results
+
+    def run_jobs(self, jobs):
+        """
+        Run the jobs over the worker processes and return their
+        (key, count) results, in no particular order.
+        """
+        processes = self.processes or multiprocessing.cpu_count()
+        queue = range(len(jobs))
+        restarts = [0] * len(jobs)
+        workers = []
+        finished = []
+        try:
+            while queue or workers:
+                while queue and len(workers) < processes:
+                    workers.append(WorkerProcess(self.client_factory,
+                                                 self.budget, self.directory))
+                for worker in workers:
+                    if worker.job is None and queue:
+                        index = queue.pop(0)
+                        worker.send(index, jobs[index])
+                busy = False
+                for worker in workers[:]:
+                    if worker.job is None:
+                        if not queue:
+                            worker.stop()
+                            workers.remove(worker)
+                        continue
+                    index = worker.job
+                    try:
+                        result = worker.result()
+                    except EOFError:
+                        # The worker died: resume its job from the
+                        # checkpoint in a new one.
+                        workers.remove(worker)
+                        worker.stop()
+                        restarts[index] += 1
+                        if restarts[index] > self.max_restarts:
+                            finished.append((jobs[index][1], None))
+                        else:
+                            queue.insert(0, index)
+                        continue
+                    if result is None:
+                        busy = True
+                        continue
+                    ok, value = result
+                    if not ok:
+                        raise value
+                    finished.append(value)
+                if busy:
+                    time.sleep(0.01)
+        finally:
+            for worker in workers:
+                worker.stop()
+        return finished
+
+    def _users_by_key(self, keys, users):
+        if isinstance(keys[0], (int, long)):
+            wanted = dict([(k, k) for k in keys])
+            field = 'id'
+        else:
+            wanted = dict([(k.lower(), k) for k in keys])
+            field = 'screen_name'
+        results = {}
+        for user in users:
+            value = user.get(field)
+            if field == 'screen_name' and value:
+                value = value.lower()
+            if value in wanted:
+                results[wanted[value]] = [user]
+        return results
+
+
+__all__ = ["Crawler", "CrawlError", "CheckpointStore", "RateBudget",
+           "WorkerProcess"]
@@ -0,0 +1,149 @@
+"""
+Seen-id deduplication for merged timelines, search results and streams.
+
+The ids that have already been seen are kept in a Bloom filter, so memory
+use is fixed by the capacity and false positive rate given up front no
+matter how many ids go through it. A false positive drops a status that was
+never seen; there are never false negatives.
+
+Example::
+
+    from twitapi import Client, iter_results
+    from twitapi.dedup import SeenFilter, dedup
+
+    seen = SeenFilter(capacity=10000000, error_rate=0.001, rotate_every=86400)
+    resp, home = twitter.statuses_home_timeline(count=200)
+    resp, mentions = twitter.statuses_mentions(count=200)
+    for status in dedup(iter_results(home), seen):
+        ...
+    for status in dedup(iter_results(mentions), seen):
+        ...
+"""
+
+import math
+import time
+from array import array
+try:
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5 # python 2.4
+
+
+class BloomFilter(object):
+    """
+    A fixed size Bloom filter over strings.
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1.")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        bits = int(math.ceil(-capacity * math.log(error_rate) /
+                             (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(bits * math.log(2) / capacity)))
+        self.num_words = (bits + 31) // 32
+        self.num_bits = self.num_words * 32
+        # 'I' is 32 bits wide on every platform we care about, unlike 'L'
+        # which is 64 bits on 64-bit Linux.
+        self.words = array('I', [0]) * self.num_words
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing (Kirsch-Mitzenmacher) from a single md5 digest.
+        digest = md5(str(key)).hexdigest()
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:], 16) | 1
+        num_bits = self.num_bits
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % num_bits
+
+    def __contains__(self, key):
+        words = self.words
+        for pos in self._positions(key):
+            if not words[pos >> 5] & (1 << (pos & 31)):
+                return False
+        return True
+
+    def add(self, key):
+        """
+        Add a key, returning True if it was (probably) already there.
+        """
+        words = self.words
+        present = True
+        for pos in self._positions(key):
+            bit = 1 << (pos & 31)
+            if not words[pos >> 5] & bit:
+                present = False
+                words[pos >> 5] |= bit
+        if not present:
+            self.count += 1
+        return present
+
+
+class SeenFilter(object):
+    """
+    A Bloom filter of seen ids that rotates over time.
+
+    Two generations are kept: ids are looked up in both and added to the
+    current one. Every `rotate_every` seconds, or once `capacity` ids were
+    added to the current filter, the older generation is dropped and memory
+    stays at two filters. An id is remembered for at least one rotation,
+    which is shorter than `rotate_every` if more than `capacity` new ids
+    arrive in that time; size the capacity for the expected id rate.
+    """
+    def __init__(self, capacity=1000000, error_rate=0.001, rotate_every=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rotate_every = rotate_every
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.rotated_at = time.time()
+
+    def rotate(self):
+        self.previous = self.current
+        self.current = BloomFilter(self.capacity, self.error_rate)
+        self.rotated_at = time.time()
+
+    def _maybe_rotate(self):
+        if self.current.count >= self.capacity or (self.rotate_every and
+                time.time() - self.rotated_at >= self.rotate_every):
+            self.rotate()
+
+    def __contains__(self, key):
+        return key in self.current or (self.previous is not None and
+                                        key in self.previous)
+
+    def add(self, key):
+        """
+        Mark a key as seen, returning True if it had already been seen.
+        """
+        self._maybe_rotate()
+        if self.previous is not None and key in self.previous:
+            self.current.add(key)
+            return True
+        return self.current.add(key)
+
+
+def status_id(status):
+    """
+    Returns the id of a status, preferring the string id when present.
+    """
+    return status.get('id_str') or status['id']
+
+
+def dedup(iterable, seen=None, key=status_id):
+    """
+    Generator that yields the items of `iterable` whose key hasn't been
+    seen before by the `seen` filter.
+
+    A new SeenFilter is used if none is given; pass the same filter to
+    several calls to deduplicate across them.
+    """
+    if seen is None:
+        seen = SeenFilter()
+    for item in iterable:
+        if not seen.add(key(item)):
+            yield item
+
+
+__all__ = ["BloomFilter", "SeenFilter", "dedup"]
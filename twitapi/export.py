@@ -0,0 +1,313 @@
+"""
+Streaming archival exporters.
+
+An exporter is a sink that can be attached to any result iterator and
+writes the records to rotating gzip files in a directory, either as
+newline-delimited json (NDJSONExporter) or as one file per column of a
+fixed status or user schema (ColumnarExporter).
+
+Records are buffered `batch_size` at a time and every batch is appended to
+the segment files as a complete gzip member, so memory use stays constant.
+Every `fsync_every` batches the files are fsynced and a small json manifest
+is rewritten with the segment number, byte offsets, record counts and the
+lowest and highest record ids written. Opening an exporter on the same
+directory after a crash truncates the segment files back to the last
+manifest and carries on from there.
+
+Timelines and search return the newest statuses first, so the highest id
+written is only a safe since_id once a whole fetch is archived. The records
+written between opening an exporter and close() form a run; if a run was
+interrupted, resume_params() returns the since_id it started from and a
+max_id just below the lowest id it wrote, so the rest of that fetch can be
+paged in. Otherwise it returns since_id=max_id. For records written oldest
+first (e.g. from a stream), resume after `max_id` instead.
+
+Example::
+
+    from twitapi import iter_results
+    from twitapi.export import NDJSONExporter
+
+    exporter = NDJSONExporter('/var/tmp/archive', prefix='home')
+    params = exporter.resume_params()
+    resp, content = twitter.statuses_home_timeline(count=200, **params)
+    for status in exporter.sink(iter_results(content)):
+        ...
+    exporter.close()
+"""
+
+import os
+import gzip
+from cStringIO import StringIO
+try:
+    import json # python 2.6
+except ImportError:
+    import simplejson as json # python 2.4 to 2.5
+
+
+def _get(record, path):
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+# Fixed columnar schemas: (column name, path into the record).
+STATUS_SCHEMA = (
+    ('id', ('id',)),
+    ('created_at', ('created_at',)),
+    ('text', ('text',)),
+    ('source', ('source',)),
+    ('user_id', ('user', 'id')),
+    ('screen_name', ('user', 'screen_name')),
+    ('in_reply_to_status_id', ('in_reply_to_status_id',)),
+    ('in_reply_to_user_id', ('in_reply_to_user_id',)),
+    ('retweeted_status_id', ('retweeted_status', 'id')),
+)
+
+USER_SCHEMA = (
+    ('id', ('id',)),
+    ('screen_name', ('screen_name',)),
+    ('name', ('name',)),
+    ('created_at', ('created_at',)),
+    ('location', ('location',)),
+    ('description', ('description',)),
+    ('followers_count', ('followers_count',)),
+    ('friends_count', ('friends_count',)),
+    ('statuses_count', ('statuses_count',)),
+    ('protected', ('protected',)),
+)
+
+
+class Exporter(object):
+    """
+    Base class of the exporters, see the module documentation.
+
+    Subclasses define streams() (the names of the files of a segment) and
+    encode() (the lines of a batch for each stream).
+    """
+    def __init__(self, directory, prefix='export', max_records=1000000,
+                 batch_size=1000, fsync_every=1, compresslevel=6):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_records = max_records
+        self.batch_size = batch_size
+        self.fsync_every = fsync_every
+        self.compresslevel = compresslevel
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.buffer = []
+        self.batches = 0
+        self.manifest_path = os.path.join(directory, prefix + '.manifest')
+        self.state = self._load_manifest()
+        self._recover()
+        if self.state['run'] is None:
+            self.state['run'] = {'since_id': self.state['max_id'],
+                                 'min_id': None}
+
+    def streams(self):
+        raise NotImplementedError
+
+    def encode(self, records):
+        raise NotImplementedError
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            f = open(self.manifest_path)
+            try:
+                return json.loads(f.read())
+            finally:
+                f.close()
+        return {'segment': 1, 'records': 0, 'total': 0, 'min_id': None,
+                'max_id': None, 'run': None, 'offsets': {}, 'segments': []}
+
+    def _write_manifest(self):
+        f = open(self.manifest_path + '.tmp', 'w')
+        try:
+            f.write(json.dumps(self.state))
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(self.manifest_path + '.tmp', self.manifest_path)
+
+    def _recover(self):
+        # Drop whatever was written to the current segment after the last
+        # manifest, e.g. a batch that was being written during a crash.
+        for stream in self.streams():
+            path = self.path(stream)
+            offset = self.state['offsets'].get(stream, 0)
+            size = 0
+            if os.path.exists(path):
+                size = os.path.getsize(path)
+            if size < offset:
+                raise Exception("%s is %d bytes long, the manifest expects "
+                                "at least %d." % (path, size, offset))
+            if size > offset:
+                f = open(path, 'r+b')
+                try:
+                    f.truncate(offset)
+                finally:
+                    f.close()
+
+    @property
+    def min_id(self):
+        return self.state['min_id']
+
+    @property
+    def max_id(self):
+        return self.state['max_id']
+
+    def resume_params(self):
+        """
+        Returns the since_id and max_id parameters to fetch the records
+        that aren't archived yet, see the module documentation.
+        """
+        run = self.state['run'] or {}
+        params = {}
+        if run.get('min_id') is not None:
+            # an interrupted run: page on below the lowest id it wrote
+            if run['since_id'] is not None:
+                params['since_id'] = run['since_id']
+            params['max_id'] = run['min_id'] - 1
+        elif self.state['max_id'] is not None:
+            params['since_id'] = self.state['max_id']
+        return params
+
+    def path(self, stream, segment=None):
+        if segment is None:
+            segment = self.state['segment']
+        return os.path.join(self.directory, '%s-%05d.%s.gz' %
+                            (self.prefix, segment, stream))
+
+    def write(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def sink(self, iterable):
+        """
+        Generator that exports the items of `iterable` as they go through.
+        """
+        for record in iterable:
+            self.write(record)
+            yield record
+
+    def flush(self, sync=False):
+        """
+        Write the buffered records as one batch.
+        """
+        while self.buffer:
+            room = self.max_records - self.state['records']
+            batch = self.buffer[:room]
+            self.buffer = self.buffer[room:]
+            self._write_batch(batch)
+            if self.state['records'] >= self.max_records:
+                self.rotate()
+        if sync or (self.fsync_every and self.batches >= self.fsync_every):
+            self._write_manifest()
+            self.batches = 0
+
+    def _write_batch(self, batch):
+        lines = self.encode(batch)
+        sync = self.fsync_every and self.batches + 1 >= self.fsync_every
+        for stream in self.streams():
+            data = StringIO()
+            member = gzip.GzipFile(fileobj=data, mode='wb',
+                                   compresslevel=self.compresslevel)
+            member.write(''.join(lines[stream]))
+            member.close()
+            f = open(self.path(stream), 'ab')
+            try:
+                f.write(data.getvalue())
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+                self.state['offsets'][stream] = f.tell()
+            finally:
+                f.close()
+        state = self.state
+        run = state['run']
+        for record in batch:
+            if isinstance(record, dict) and record.get('id') is not None:
+                id = record['id']
+                if state['max_id'] is None or id > state['max_id']:
+                    state['max_id'] = id
+                if state['min_id'] is None or id < state['min_id']:
+                    state['min_id'] = id
+                if run is not None and (run['min_id'] is None or
+                                        id < run['min_id']):
+                    run['min_id'] = id
+        self.state['records'] += len(batch)
+        self.state['total'] += len(batch)
+        self.batches += 1
+
+    def rotate(self):
+        """
+        Close the current segment and start a new one.
+        """
+        if self.state['records']:
+            self.state['segments'].append({'segment': self.state['segment'],
+                                           'records': self.state['records']})
+            self.state['segment'] += 1
+            self.state['records'] = 0
+            self.state['offsets'] = {}
+            self._write_manifest()
+            self.batches = 0
+
+    def close(self):
+        """
+        Write the buffered records and mark the run as complete.
+        """
+        self.state['run'] = None
+        self.flush(sync=True)
+
+
+class NDJSONExporter(Exporter):
+    """
+    Exports records as gzipped newline-delimited json.
+    """
+    def streams(self):
+        return ('ndjson',)
+
+    def encode(self, records):
+        dumps = json.dumps
+        return {'ndjson': [dumps(record) + '\n' for record in records]}
+
+
+class ColumnarExporter(Exporter):
+    """
+    Exports the columns of a fixed schema (STATUS_SCHEMA or USER_SCHEMA) to
+    one gzipped file per column, one json value per line.
+    """
+    def __init__(self, directory, prefix='export', schema=STATUS_SCHEMA,
+                 **kwargs):
+        self.schema = schema
+        Exporter.__init__(self, directory, prefix, **kwargs)
+
+    def streams(self):
+        return tuple([name for name, path in self.schema])
+
+    def encode(self, records):
+        dumps = json.dumps
+        columns = {}
+        for name, path in self.schema:
+            columns[name] = [dumps(_get(record, path)) + '\n'
+                             for record in records]
+        return columns
+
+
+def read_ndjson(path):
+    """
+    Generator that yields the records of an exported ndjson file.
+    """
+    f = gzip.open(path)
+    try:
+        for line in f:
+            yield json.loads(line)
+    finally:
+        f.close()
+
+
+__all__ = ["NDJSONExporter", "ColumnarExporter", "STATUS_SCHEMA",
+           "USER_SCHEMA", "read_ndjson"]
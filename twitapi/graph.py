@@ -0,0 +1,176 @@
+"""
+Bulk follow relationships between sets of users.
+
+friendships_exists answers one pair per request, so checking which of N
+accounts follow which of M others costs N*M requests. RelationshipMatrix
+instead fetches the friends_ids (or followers_ids) of the smaller side once,
+keeps them as frozensets, and answers every row of pairs with one set
+intersection.
+
+Example::
+
+    from twitapi.graph import RelationshipMatrix
+
+    matrix = RelationshipMatrix(twitter)
+    follows = matrix.follows([12, 13, 14], [783214, 6253282, 15])
+    if follows[(12, 783214)]:
+        ...
+
+Users must be given as numeric user ids, since that is what friends_ids and
+followers_ids return. The id lists of protected or deleted accounts can't be
+fetched (401 or 404); their pairs are checked with friendships_exists
+instead, and are None in the result when that fails too.
+"""
+
+from twitapi import concurrent_map, cursor_pages
+
+
+class IdSet(object):
+    """
+    An immutable set of user ids.
+
+    The ids are kept in a frozenset rather than an array: array('l') is 32
+    bits wide on Windows, too narrow for current user ids, and set
+    intersections run in C over the smaller of the two sets.
+    """
+    def __init__(self, ids):
+        self.ids = frozenset(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, id):
+        return id in self.ids
+
+    def intersection(self, other):
+        """
+        Returns the members of `other` (any iterable of ids) in this set.
+        """
+        if not isinstance(other, (set, frozenset)):
+            other = frozenset(other)
+        return self.ids & other
+
+
+# Statuses for which a user's relationships are unavailable rather than
+# the request having failed.
+UNAVAILABLE = ('401', '403', '404')
+
+
+class FetchError(Exception):
+    """
+    Raised when a page of ids can't be fetched.
+    """
+    def __init__(self, status):
+        Exception.__init__(self, "Invalid response %s." % status)
+        self.status = status
+
+
+def fetch_ids(client, method_name, user_id):
+    """
+    Fetch every page of friends_ids or followers_ids for a user and return
+    them as an IdSet.
+    """
+    ids = []
+    for resp, content in cursor_pages(getattr(client, method_name),
+                                      user_id=user_id):
+        if resp['status'] != '200':
+            raise FetchError(resp['status'])
+        ids.extend(content['ids'])
+    return IdSet(ids)
+
+
+class RelationshipMatrix(object):
+    """
+    Answers "does a follow b" for every pair of two sets of users.
+
+    Fetched id sets are kept in `friends` and `followers` (dicts of user id
+    to IdSet) and reused by later calls. When there are at most
+    `pairwise_limit` pairs, single friendships_exists calls are used
+    instead, since fetching the id lists would take at least as many
+    requests.
+    """
+    def __init__(self, client, threads=10, pairwise_limit=1):
+        self.client = client
+        self.threads = threads
+        self.pairwise_limit = pairwise_limit
+        self.friends = {}
+        self.followers = {}
+
+    def _fetch(self, method_name, cache, user_ids):
+        """
+        Fetch the missing id sets into `cache`. Returns the user ids whose
+        ids are unavailable.
+        """
+        missing = [id for id in user_ids if id not in cache]
+        def fetch(id):
+            return fetch_ids(self.client, method_name, id)
+        unavailable = []
+        for id, ids, error in concurrent_map(fetch, missing, self.threads):
+            if error is not None:
+                if isinstance(error, FetchError) and \
+                                        error.status in UNAVAILABLE:
+                    unavailable.append(id)
+                    continue
+                raise error
+            cache[id] = ids
+        return unavailable
+
+    def _pairwise(self, sources, targets):
+        matrix = {}
+        for a in sources:
+            for b in targets:
+                resp, content = self.client.friendships_exists(a, b)
+                if resp['status'] in UNAVAILABLE:
+                    matrix[(a, b)] = None
+                elif resp['status'] != '200':
+                    raise Exception("Invalid response %s." % resp['status'])
+                else:
+                    matrix[(a, b)] = content is True
+        return matrix
+
+    def follows(self, sources, targets):
+        """
+        Returns a dict mapping each (source, target) pair to True if source
+        follows target, False if not, or None if that can't be told (the
+        accounts are protected or gone).
+        """
+        sources = list(sources)
+        targets = list(targets)
+        if len(sources) * len(targets) <= self.pairwise_limit:
+            return self._pairwise(sources, targets)
+
+        matrix = dict([((a, b), False) for a in sources for b in targets])
+        # Fetch the id lists of whichever side needs fewer of them (not
+        # counting the ones already fetched).
+        need_friends = len([a for a in sources if a not in self.friends])
+        need_followers = len([b for b in targets
+                              if b not in self.followers])
+        if need_friends <= need_followers:
+            unavailable = self._fetch('friends_ids', self.friends, sources)
+            wanted = frozenset(targets)
+            for a in sources:
+                if a in unavailable:
+                    continue
+                for b in self.friends[a].intersection(wanted):
+                    matrix[(a, b)] = True
+            matrix.update(self._pairwise(unavailable, targets))
+        else:
+            unavailable = self._fetch('followers_ids', self.followers, targets)
+            wanted = frozenset(sources)
+            for b in targets:
+                if b in unavailable:
+                    continue
+                for a in self.followers[b].intersection(wanted):
+                    matrix[(a, b)] = True
+            matrix.update(self._pairwise(sources, unavailable))
+        return matrix
+
+    def followed_by(self, sources, target):
+        """
+        Returns the subset of `sources` that follow `target`.
+        """
+        matrix = self.follows(sources, [target])
+        return set([a for a in sources if matrix[(a, target)]])
+
+
+__all__ = ["RelationshipMatrix", "IdSet", "FetchError", "fetch_ids"]
@@ -0,0 +1,315 @@
+"""
+Local inverted index over fetched statuses for offline search.
+
+Statuses from search and the timeline methods are tokenized as they go
+through the index and kept, together with postings lists for their words,
+hashtags, mentions and authors, in an on-disk shelve. The index answers the
+common operators of the Search API without a network call:
+
+* ``word`` - statuses containing the word
+* ``"a phrase"`` - statuses containing the exact phrase
+* ``#tag`` - statuses with the hashtag
+* ``@user`` - statuses mentioning the user
+* ``from:user`` - statuses sent by the user (screen name or user id)
+* ``to:user`` - statuses in reply to the user
+* ``-term`` - statuses not matching the term (a word, phrase, #tag, ...)
+* ``a OR b`` - statuses matching either term
+
+All the other terms of a query must match.
+
+Example::
+
+    from twitapi import Client, iter_results
+    from twitapi.index import StatusIndex
+
+    index = StatusIndex('/var/tmp/tweets.idx')
+    resp, content = twitter.search('beer')
+    for status in index.sink(iter_results(content)):
+        ...
+    index.flush()
+
+    index.search('from:r1cky #python "new release"')
+"""
+
+import re
+import shelve
+
+WORD_RE = re.compile(r"[#@]?\w+", re.UNICODE)
+QUERY_RE = re.compile(r'(-?)"([^"]*)"|(\S+)', re.UNICODE)
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _lower(value):
+    if isinstance(value, str):
+        value = value.decode('utf-8')
+    return value.lower()
+
+
+def _key(term):
+    return term.encode('utf-8')
+
+
+def status_fields(status):
+    """
+    Returns (from, from_id, to, to_id) for a status from the Search API
+    or from one of the REST API timelines.
+    """
+    user = status.get('user')
+    if user:
+        return (user.get('screen_name'), user.get('id'),
+                status.get('in_reply_to_screen_name'),
+                status.get('in_reply_to_user_id'))
+    return (status.get('from_user'), status.get('from_user_id'),
+            status.get('to_user'), status.get('to_user_id'))
+
+
+def tokenize(status):
+    """
+    Returns the set of index terms for a status.
+    """
+    terms = set()
+    for token in WORD_RE.findall(_lower(status.get('text') or u'')):
+        if token[0] == '#':
+            terms.add(u'h:' + token[1:])
+            terms.add(u'w:' + token[1:])
+        elif token[0] == '@':
+            terms.add(u'm:' + token[1:])
+        else:
+            terms.add(u'w:' + token)
+    sender, sender_id, to, to_id = status_fields(status)
+    if sender:
+        terms.add(u'f:' + _lower(sender))
+    if sender_id:
+        terms.add(u'f:%s' % sender_id)
+    if to:
+        terms.add(u't:' + _lower(to))
+        terms.add(u'm:' + _lower(to))
+    if to_id:
+        terms.add(u't:%s' % to_id)
+    return terms
+
+
+def contains_phrase(text, phrase):
+    """
+    Returns True if the words of `phrase` appear consecutively in `text`.
+    """
+    words = TOKEN_RE.findall(_lower(text))
+    wanted = TOKEN_RE.findall(_lower(phrase))
+    if not wanted:
+        return True
+    size = len(wanted)
+    for i in range(len(words) - size + 1):
+        if words[i:i + size] == wanted:
+            return True
+    return False
+
+
+def _query_terms(text):
+    # The index terms a status containing `text` must have, matching how
+    # tokenize() indexes hashtags and mentions.
+    terms = []
+    for token in WORD_RE.findall(text):
+        if token[0] == '#':
+            terms.append(u'h:' + token[1:])
+        elif token[0] == '@':
+            terms.append(u'm:' + token[1:])
+        else:
+            terms.append(u'w:' + token)
+    return terms
+
+
+def _word_terms(word):
+    if word.startswith('from:'):
+        return [u'f:' + word[5:].lstrip('@')]
+    if word.startswith('to:'):
+        return [u't:' + word[3:].lstrip('@')]
+    return _query_terms(word)
+
+
+def parse_query(q):
+    """
+    Returns the clauses of a search query, all of which must match.
+
+    A clause is a (negated, alternatives) tuple and matches when any of its
+    alternatives does (or, if negated, when none does). An alternative is a
+    (terms, phrase) tuple: every index term must be present, and the phrase,
+    unless it is None, must appear in the text.
+    """
+    clauses = []
+    either = False
+    for negated, phrase, word in QUERY_RE.findall(q):
+        if word == 'OR':
+            if not clauses or either:
+                raise Exception("OR must be between two terms.")
+            either = True
+            continue
+        if word:
+            word = _lower(word)
+            negated = word[0] == '-' and len(word) > 1
+            if negated:
+                word = word[1:]
+            alternative = (_word_terms(word), None)
+        else:
+            phrase = _lower(phrase)
+            alternative = (_query_terms(phrase), phrase)
+        negated = bool(negated)
+        if not alternative[0]:
+            if either:
+                raise Exception("OR must be between two terms.")
+            continue
+        if either:
+            if negated or clauses[-1][0]:
+                raise Exception("OR can't be used with excluded terms.")
+            clauses[-1][1].append(alternative)
+            either = False
+        else:
+            clauses.append((negated, [alternative]))
+    if either:
+        raise Exception("OR must be between two terms.")
+    return clauses
+
+
+def _matches(terms, text, alternatives):
+    for alt_terms, phrase in alternatives:
+        if [t for t in alt_terms if t not in terms]:
+            continue
+        if phrase is None or contains_phrase(text, phrase):
+            return True
+    return False
+
+
+class StatusIndex(object):
+    """
+    An on-disk inverted index of statuses.
+
+    New statuses are buffered in memory and written to disk by flush()
+    (automatically every `flush_every` statuses). Each flush appends one
+    new postings block per term instead of rewriting the term's whole
+    list, and the blocks are merged when the term is read; compact()
+    merges them on disk.
+    """
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self.db = shelve.open(path, protocol=2)
+        self.pending = {}
+        self.pending_count = 0
+
+    def add(self, status):
+        """
+        Add a status to the index. Statuses already indexed are skipped.
+        """
+        id = status['id']
+        skey = 's:%s' % id
+        if skey in self.db:
+            return
+        self.db[skey] = status
+        for term in tokenize(status):
+            self.pending.setdefault(term, []).append(id)
+        self.pending_count += 1
+        if self.pending_count >= self.flush_every:
+            self.flush()
+
+    def sink(self, iterable):
+        """
+        Generator that indexes the items of `iterable` as they go through.
+        """
+        for status in iterable:
+            self.add(status)
+            yield status
+
+    def flush(self):
+        """
+        Write the buffered postings to disk as one new block per term.
+        """
+        for term, ids in self.pending.iteritems():
+            key = _key(term)
+            blocks = self.db.get('n:' + key, 0)
+            self.db['p:%s:%d' % (key, blocks)] = ids
+            self.db['n:' + key] = blocks + 1
+        self.pending = {}
+        self.pending_count = 0
+        self.db.sync()
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def postings(self, term):
+        key = _key(term)
+        ids = []
+        for block in range(self.db.get('n:' + key, 0)):
+            ids.extend(self.db['p:%s:%d' % (key, block)])
+        ids.extend(self.pending.get(term, []))
+        return ids
+
+    def compact(self):
+        """
+        Merge the postings blocks of every term into a single block.
+        """
+        self.flush()
+        for key in self.db.keys():
+            if not key.startswith('n:') or self.db[key] < 2:
+                continue
+            key = key[2:]
+            blocks = self.db['n:' + key]
+            ids = []
+            for block in range(blocks):
+                ids.extend(self.db.pop('p:%s:%d' % (key, block)))
+            ids.sort()
+            self.db['p:%s:0' % key] = ids
+            self.db['n:' + key] = 1
+        self.db.sync()
+
+    def search(self, q, rpp=None):
+        """
+        Returns the indexed statuses matching `q`, most recent first.
+        """
+        clauses = parse_query(q)
+        if not clauses:
+            return []
+        required = [alternatives for negated, alternatives in clauses
+                    if not negated]
+        excluded = [alternatives for negated, alternatives in clauses
+                    if negated]
+        if not required:
+            raise Exception("A query needs a term that isn't excluded.")
+
+        # Candidates from the postings: for each required clause, the
+        # union over its alternatives of the ids having all their terms.
+        candidates = []
+        for alternatives in required:
+            ids = set()
+            for terms, phrase in alternatives:
+                postings = [self.postings(term) for term in set(terms)]
+                postings.sort(key=len)
+                matches = set(postings[0])
+                for more in postings[1:]:
+                    if not matches:
+                        break
+                    matches.intersection_update(more)
+                ids.update(matches)
+            candidates.append(ids)
+        candidates.sort(key=len)
+        matches = candidates[0]
+        for ids in candidates[1:]:
+            matches.intersection_update(ids)
+
+        results = []
+        for id in sorted(matches, reverse=True):
+            status = self.db['s:%s' % id]
+            terms = tokenize(status)
+            text = status.get('text') or u''
+            if [a for a in required if not _matches(terms, text, a)] or \
+                    [a for a in excluded if _matches(terms, text, a)]:
+                continue
+            results.append(status)
+            if rpp and len(results) >= rpp:
+                break
+        return results
+
+    def __len__(self):
+        return len([k for k in self.db.keys() if k.startswith('s:')])
+
+
+__all__ = ["StatusIndex", "tokenize", "parse_query"]
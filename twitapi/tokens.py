@@ -0,0 +1,174 @@
+"""
+Multi-user OAuth token store.
+
+Maps user keys (e.g. your own user ids) to their access tokens, in a local
+shelve file with an LRU cache in front of it. Signing contexts for a user
+share the application's consumer, so getting a Client for a user is cheap.
+
+Example::
+
+    from twitapi.tokens import TokenStore
+
+    store = TokenStore(CONSUMER_KEY, CONSUMER_SECRET, '/var/tmp/tokens.db')
+    store.set('alice', access_token)   # as returned by get_access_token()
+    twitter = store.client('alice')
+    twitter.statuses_update('Hello from python-twitapi')
+
+    # check every stored token, flagging those that were revoked
+    results = store.verify_all(threads=20)
+"""
+
+import shelve
+
+from twitapi import OAuth, Client, LRUCache, concurrent_map
+
+
+class TokenStore(object):
+    """
+    A persistent store of OAuth access tokens for many users.
+
+    Neither shelve nor LRUCache is thread-safe, so every access to them goes
+    through a lock and the store can be shared by threads.
+    """
+    def __init__(self, consumer_key, consumer_secret, path, cache_size=10000):
+        import threading
+        self.oauth = OAuth(consumer_key, consumer_secret)
+        self.db = shelve.open(path, protocol=2)
+        self.cache = LRUCache(cache_size)
+        self.lock = threading.RLock()
+
+    def _key(self, user_key):
+        if isinstance(user_key, unicode):
+            return user_key.encode('utf-8')
+        return str(user_key)
+
+    def _record(self, user_key):
+        key = self._key(user_key)
+        self.lock.acquire()
+        try:
+            record = self.cache.get(key)
+            if record is None:
+                record = self.db.get(key)
+                if record is not None:
+                    self.cache[key] = record
+            return record
+        finally:
+            self.lock.release()
+
+    def get(self, user_key):
+        """
+        Returns the token of a user, or None if there is no token or it has
+        been revoked.
+        """
+        record = self._record(user_key)
+        if record is None or record.get('revoked'):
+            return None
+        return record['token']
+
+    def set(self, user_key, token):
+        """
+        Store a user's token (a dict with oauth_token and
+        oauth_token_secret).
+        """
+        key = self._key(user_key)
+        record = {'token': {'oauth_token': token['oauth_token'],
+                            'oauth_token_secret': token['oauth_token_secret']},
+                  'revoked': False}
+        self.lock.acquire()
+        try:
+            self.db[key] = record
+            self.cache[key] = record
+        finally:
+            self.lock.release()
+
+    def delete(self, user_key):
+        key = self._key(user_key)
+        self.lock.acquire()
+        try:
+            self.cache.pop(key)
+            if key in self.db:
+                del self.db[key]
+        finally:
+            self.lock.release()
+
+    def revoke(self, user_key):
+        """
+        Flag a user's token as revoked.
+        """
+        key = self._key(user_key)
+        self.lock.acquire()
+        try:
+            record = self._record(user_key)
+            if record is not None:
+                record = dict(record, revoked=True)
+                self.db[key] = record
+                self.cache[key] = record
+        finally:
+            self.lock.release()
+
+    def is_revoked(self, user_key):
+        record = self._record(user_key)
+        return bool(record and record.get('revoked'))
+
+    def keys(self):
+        self.lock.acquire()
+        try:
+            return self.db.keys()
+        finally:
+            self.lock.release()
+
+    def auth(self, user_key):
+        """
+        Returns an OAuth signing context for a user, or None.
+        """
+        token = self.get(user_key)
+        if token is None:
+            return None
+        return self.oauth.for_token(token)
+
+    def client(self, user_key, **kwargs):
+        """
+        Returns a Client for a user. Keyword arguments are passed to Client.
+        """
+        auth = self.auth(user_key)
+        if auth is None:
+            raise Exception("No valid token for %s." % user_key)
+        return Client(auth, **kwargs)
+
+    def verify_all(self, user_keys=None, threads=10, **kwargs):
+        """
+        Call verify_credentials for every stored token (or the given
+        user_keys) over a pool of threads. Tokens rejected with a 401 are
+        flagged as revoked.
+
+        Returns a dict of user key to response status.
+        """
+        if user_keys is None:
+            user_keys = self.keys()
+        auths = []
+        for user_key in user_keys:
+            auth = self.auth(user_key)
+            if auth is not None:
+                auths.append((user_key, auth))
+
+        def verify((user_key, auth)):
+            resp, content = Client(auth, **kwargs).verify_credentials()
+            return resp['status']
+
+        statuses = {}
+        for (user_key, auth), status, error in concurrent_map(verify, auths,
+                                                              threads):
+            statuses[user_key] = status
+            if status == '401':
+                self.revoke(user_key)
+        return statuses
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.db.close()
+        finally:
+            self.lock.release()
+
+
+__all__ = ["TokenStore"]
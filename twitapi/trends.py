@@ -0,0 +1,346 @@
+"""
+Trends time-series collector and store.
+
+The collector polls trends_current, trends_daily and trends_weekly and
+keeps the rank of every topic over time in a small columnar store: one
+binary column each for the timestamp, topic number and rank, plus a list of
+topic names. Dates that were already collected are never asked for again,
+and rank history queries only read the three compact columns.
+
+Hourly slices (from trends_current and trends_daily) and daily slices (from
+trends_weekly) are stored as two separate series. Hourly slices are keyed by
+the hour they fall in, so the same hour reported by trends_current and by
+trends_daily is only stored once.
+
+Each series records its row count in a small file that is replaced after
+the columns were appended; on open, columns longer than that (from a crash
+in the middle of a slice) are cut back to it.
+
+Example::
+
+    from datetime import date, timedelta
+    from twitapi import Client
+    from twitapi.trends import TrendsCollector, TrendsStore
+
+    store = TrendsStore('/var/tmp/trends')
+    collector = TrendsCollector(Client(), store)
+    collector.collect_daily(date.today() - timedelta(days=30))
+    store.rank_history('#python', days=30)
+"""
+
+import os
+import time
+import calendar
+from array import array
+from datetime import date, timedelta
+
+HOURLY = 'hourly'
+DAILY = 'daily'
+
+# Fixed width typecodes, so the columns are compact and read the same on
+# every platform ('l' is 64 bits on 64-bit Linux and 32 bits on Windows):
+# 32-bit topic numbers, 8-bit ranks and unsigned 32-bit epoch seconds.
+TOPIC = 'i'
+RANK = 'B'
+TIME = 'I'
+
+COLUMNS = (('topic', TOPIC), ('rank', RANK), ('time', TIME))
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def parse_timestamp(value):
+    """
+    Returns the epoch seconds of a trends slice key.
+    """
+    for format in TIME_FORMATS:
+        try:
+            return calendar.timegm(time.strptime(value, format))
+        except ValueError:
+            pass
+    raise ValueError("Unknown trends timestamp %r." % value)
+
+
+def _read_column(path, typecode):
+    column = array(typecode)
+    if os.path.exists(path):
+        f = open(path, 'rb')
+        try:
+            column.fromstring(f.read())
+        finally:
+            f.close()
+    return column
+
+
+def _append_column(path, column):
+    f = open(path, 'ab')
+    try:
+        column.tofile(f)
+    finally:
+        f.close()
+
+
+class TrendsSeries(object):
+    """
+    One append-only series of (timestamp, topic, rank) rows.
+    """
+    def __init__(self, directory, topics):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.topics = topics
+        self.rows_path = os.path.join(directory, 'rows')
+        self.rows = self._recover()
+        self.times = _read_column(self._path('time'), TIME)
+        self.timestamps = set(self.times)
+
+    def _path(self, column):
+        return os.path.join(self.directory, column + '.col')
+
+    def _recover(self):
+        # Cut every column back to the row count of the last complete
+        # slice, dropping the rows of a slice that was being appended.
+        sizes = []
+        for column, typecode in COLUMNS:
+            path = self._path(column)
+            size = 0
+            if os.path.exists(path):
+                size = os.path.getsize(path) // array(typecode).itemsize
+            sizes.append(size)
+        if os.path.exists(self.rows_path):
+            f = open(self.rows_path)
+            try:
+                rows = int(f.read().strip() or 0)
+            finally:
+                f.close()
+        else:
+            rows = min(sizes)
+        for (column, typecode), size in zip(COLUMNS, sizes):
+            if size != rows:
+                if size < rows:
+                    raise Exception("Column %s of %s has %d rows, expected "
+                                    "%d." % (column, self.directory, size,
+                                             rows))
+                f = open(self._path(column), 'r+b')
+                try:
+                    f.truncate(rows * array(typecode).itemsize)
+                finally:
+                    f.close()
+        return rows
+
+    def _write_rows(self):
+        f = open(self.rows_path + '.tmp', 'w')
+        try:
+            f.write('%d\n' % self.rows)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(self.rows_path + '.tmp', self.rows_path)
+
+    def add_slice(self, timestamp, names):
+        """
+        Append the ranked topic names of one time slice. Returns False if
+        the slice was already stored.
+        """
+        if timestamp in self.timestamps or not names:
+            return False
+        topic_ids = array(TOPIC, [self.topics.id_for(n) for n in names])
+        ranks = array(RANK, range(1, len(names) + 1))
+        times = array(TIME, [timestamp]) * len(names)
+        _append_column(self._path('topic'), topic_ids)
+        _append_column(self._path('rank'), ranks)
+        _append_column(self._path('time'), times)
+        self.rows += len(names)
+        self._write_rows()
+        self.times.extend(times)
+        self.timestamps.add(timestamp)
+        return True
+
+    def rank_history(self, topic_id, since=None):
+        """
+        Returns the [(timestamp, rank), ...] rows of a topic.
+        """
+        topic_ids = _read_column(self._path('topic'), TOPIC)
+        ranks = _read_column(self._path('rank'), RANK)
+        times = self.times
+        history = []
+        for i in range(len(topic_ids)):
+            if topic_ids[i] == topic_id and (since is None or
+                                             times[i] >= since):
+                history.append((times[i], ranks[i]))
+        history.sort()
+        return history
+
+
+class TopicNames(object):
+    """
+    The topic name dictionary shared by the series, one name per line.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.names = []
+        self.ids = {}
+        if os.path.exists(path):
+            f = open(path)
+            try:
+                for line in f:
+                    self._add(line.rstrip('\n').decode('utf-8'))
+            finally:
+                f.close()
+
+    def _add(self, name):
+        self.ids[name] = len(self.names)
+        self.names.append(name)
+
+    def get(self, name):
+        if isinstance(name, str):
+            name = name.decode('utf-8')
+        return self.ids.get(name)
+
+    def id_for(self, name):
+        if isinstance(name, str):
+            name = name.decode('utf-8')
+        if name not in self.ids:
+            f = open(self.path, 'a')
+            try:
+                f.write(name.replace('\n', ' ').encode('utf-8') + '\n')
+            finally:
+                f.close()
+            self._add(name)
+        return self.ids[name]
+
+
+class TrendsStore(object):
+    """
+    A columnar on-disk store of trending topic ranks over time.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.topics = TopicNames(os.path.join(directory, 'topics.txt'))
+        self.series = {
+            HOURLY: TrendsSeries(os.path.join(directory, HOURLY), self.topics),
+            DAILY: TrendsSeries(os.path.join(directory, DAILY), self.topics),
+        }
+        self.dates_path = os.path.join(directory, 'dates.txt')
+        self.dates = set()
+        if os.path.exists(self.dates_path):
+            f = open(self.dates_path)
+            try:
+                self.dates = set([line.strip() for line in f])
+            finally:
+                f.close()
+
+    def add_response(self, content, series=HOURLY):
+        """
+        Store every slice of a trends_current, trends_daily or
+        trends_weekly response. Returns the number of new slices.
+        """
+        added = 0
+        trends = content.get('trends') or {}
+        for key, topics in trends.items():
+            names = [t['name'] for t in topics]
+            timestamp = parse_timestamp(key)
+            if series == HOURLY:
+                timestamp -= timestamp % 3600
+            if self.series[series].add_slice(timestamp, names):
+                added += 1
+        return added
+
+    def has_date(self, kind, day):
+        return '%s %s' % (kind, day) in self.dates
+
+    def mark_date(self, kind, day):
+        entry = '%s %s' % (kind, day)
+        f = open(self.dates_path, 'a')
+        try:
+            f.write(entry + '\n')
+        finally:
+            f.close()
+        self.dates.add(entry)
+
+    def rank_history(self, topic, days=None, series=HOURLY):
+        """
+        Returns the [(timestamp, rank), ...] history of a topic, optionally
+        limited to the last `days` days.
+        """
+        topic_id = self.topics.get(topic)
+        if topic_id is None:
+            return []
+        since = None
+        if days is not None:
+            since = int(time.time()) - days * 86400
+        return self.series[series].rank_history(topic_id, since)
+
+
+class TrendsCollector(object):
+    """
+    Polls the trends methods of a Client into a TrendsStore.
+    """
+    def __init__(self, client, store, interval=3600):
+        self.client = client
+        self.store = store
+        self.interval = interval
+        self.last_poll = 0
+
+    def poll_current(self):
+        """
+        Fetch the current trends, unless they were polled less than
+        `interval` seconds ago (they only change hourly).
+        """
+        if time.time() - self.last_poll < self.interval:
+            return 0
+        resp, content = self.client.trends_current()
+        if resp['status'] != '200':
+            raise Exception("Invalid response %s." % resp['status'])
+        self.last_poll = time.time()
+        return self.store.add_response(content, HOURLY)
+
+    def collect_daily(self, start, end=None):
+        """
+        Fetch the hourly trends of each day from `start` to `end` (today by
+        default) that isn't in the store yet. Only days that are over are
+        marked as collected, so today is fetched again on the next call.
+        """
+        return self._collect('daily', self.client.trends_daily, HOURLY,
+                             start, end, 1)
+
+    def collect_weekly(self, start, end=None):
+        """
+        Fetch the daily trends of each week from `start` to `end` that
+        isn't in the store yet.
+        """
+        return self._collect('weekly', self.client.trends_weekly, DAILY,
+                             start, end, 7)
+
+    def _collect(self, kind, method, series, start, end, step):
+        today = date.today()
+        if end is None:
+            end = today
+        added = 0
+        day = start
+        while day <= end:
+            if not self.store.has_date(kind, day):
+                resp, content = method(date=day)
+                if resp['status'] != '200':
+                    raise Exception("Invalid response %s." % resp['status'])
+                added += self.store.add_response(content, series)
+                if day + timedelta(days=step) <= today:
+                    self.store.mark_date(kind, day)
+            day += timedelta(days=step)
+        return added
+
+    def run(self):
+        """
+        Poll forever: the current trends every `interval` seconds and the
+        daily report of each day once it is over.
+        """
+        while True:
+            self.poll_current()
+            self.collect_daily(date.today() - timedelta(days=1))
+            time.sleep(self.interval)
+
+
+__all__ = ["TrendsCollector", "TrendsStore"]
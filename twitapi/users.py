@@ -0,0 +1,230 @@
+"""
+Identity-mapped user profile cache.
+
+A UserCache attached to a Client picks up every user object found in the
+responses it decodes (status['user'] in timelines, users_show,
+users_lookup, statuses_friends, ...) and replaces it with one canonical dict
+per user id, updated in place with the newest data. Lookups by user id or
+screen name don't need a request while the user is cached, and stale
+entries can be refreshed in the background with batched users_lookup
+calls.
+
+Example::
+
+    from twitapi import Client
+    from twitapi.users import UserCache
+
+    users = UserCache(max_size=100000, max_age=3600)
+    twitter = Client(auth, user_cache=users)
+    users.start_refresher(twitter)
+
+    resp, timeline = twitter.statuses_home_timeline()
+    users.get_by_screen_name('r1cky')
+    users.stats()
+"""
+
+import time
+
+from twitapi import LRUCache
+
+USERS_LOOKUP_CHUNK = 100
+
+
+def is_user(obj):
+    return isinstance(obj, dict) and 'screen_name' in obj and 'id' in obj \
+                                 and 'text' not in obj
+
+
+class UserCache(object):
+    """
+    A bounded cache of user objects keyed by user id, with a secondary
+    screen name index.
+    """
+    def __init__(self, max_size=10000, max_age=None):
+        import threading
+        self.cache = LRUCache(max_size)
+        self.max_age = max_age
+        self.screen_names = {}
+        self.lock = threading.RLock()
+        self.added = 0
+        self.merged = 0
+        self.evicted = 0
+        self.refresh_errors = 0
+        self.last_refresh_error = None
+
+    def _canonical(self, user):
+        id = user['id']
+        entry = self.cache.peek(id)
+        if entry is not None:
+            canonical = entry[0]
+            if canonical is not user:
+                canonical.update(user)
+            self.merged += 1
+        else:
+            canonical = user
+            self.added += 1
+        self.cache[id] = (canonical, time.time())
+        self.screen_names[canonical['screen_name'].lower()] = id
+        if len(self.screen_names) > 2 * self.cache.max_size:
+            self._reindex()
+        return canonical
+
+    def _reindex(self):
+        self.screen_names = dict([(user['screen_name'].lower(), id)
+                                  for id, (user, fetched)
+                                  in self.cache.items()])
+
+    def absorb(self, content):
+        """
+        Cache the users found in a decoded response, replacing them with
+        their canonical objects. Returns the content, or the canonical
+        object if the content is a single user.
+        """
+        self.lock.acquire()
+        try:
+            return self._absorb(content)
+        finally:
+            self.lock.release()
+
+    def _absorb(self, content):
+        if isinstance(content, list):
+            for i in range(len(content)):
+                item = content[i]
+                if is_user(item):
+                    content[i] = self._canonical(item)
+                elif isinstance(item, dict):
+                    self._absorb(item)
+        elif isinstance(content, dict):
+            if is_user(content):
+                return self._canonical(content)
+            for key in ('user', 'sender', 'recipient'):
+                if is_user(content.get(key)):
+                    content[key] = self._canonical(content[key])
+            if isinstance(content.get('retweeted_status'), dict):
+                self._absorb(content['retweeted_status'])
+            for key in ('users', 'results'):
+                if isinstance(content.get(key), list):
+                    self._absorb(content[key])
+        return content
+
+    def get(self, user_id):
+        """
+        Returns the cached user with the given id, or None.
+        """
+        self.lock.acquire()
+        try:
+            entry = self.cache.get(user_id)
+        finally:
+            self.lock.release()
+        if entry is None:
+            return None
+        return entry[0]
+
+    def get_by_screen_name(self, screen_name):
+        """
+        Returns the cached user with the given screen name, or None.
+        """
+        self.lock.acquire()
+        try:
+            id = self.screen_names.get(screen_name.lower())
+            entry = self.cache.get(id)
+            if entry is None or \
+                    entry[0]['screen_name'].lower() != screen_name.lower():
+                self.screen_names.pop(screen_name.lower(), None)
+                return None
+            return entry[0]
+        finally:
+            self.lock.release()
+
+    def stale_ids(self):
+        """
+        Returns the ids of the users fetched more than max_age seconds ago.
+        """
+        if self.max_age is None:
+            return []
+        oldest = time.time() - self.max_age
+        self.lock.acquire()
+        try:
+            return [id for id, (user, fetched) in self.cache.items()
+                    if fetched < oldest]
+        finally:
+            self.lock.release()
+
+    def evict(self, user_id):
+        """
+        Drop a user from the cache.
+        """
+        self.lock.acquire()
+        try:
+            entry = self.cache.pop(user_id)
+            if entry is not None:
+                name = entry[0]['screen_name'].lower()
+                if self.screen_names.get(name) == user_id:
+                    del self.screen_names[name]
+                self.evicted += 1
+        finally:
+            self.lock.release()
+
+    def refresh(self, client, user_ids=None):
+        """
+        Refresh the given (by default the stale) users with batched
+        users_lookup calls. Returns the number of users refreshed.
+
+        Users that users_lookup doesn't return (suspended or deleted
+        accounts) are evicted, so they aren't asked for again.
+        """
+        if user_ids is None:
+            user_ids = self.stale_ids()
+        refreshed = 0
+        for i in range(0, len(user_ids), USERS_LOOKUP_CHUNK):
+            chunk = user_ids[i:i + USERS_LOOKUP_CHUNK]
+            resp, content = client.users_lookup(user_id=chunk)
+            if resp['status'] == '404':
+                # none of the users exist any more
+                content = []
+            elif resp['status'] != '200':
+                raise Exception("Invalid response %s." % resp['status'])
+            if getattr(client, 'user_cache', None) is not self:
+                self.absorb(content)
+            returned = set([user['id'] for user in content])
+            for id in chunk:
+                if id not in returned:
+                    self.evict(id)
+            refreshed += len(content)
+        return refreshed
+
+    def start_refresher(self, client, interval=60):
+        """
+        Refresh stale users every `interval` seconds in a background thread.
+
+        A failed refresh is retried on the next interval; the number of
+        failures and the last error are reported by stats().
+        """
+        import threading
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh(client)
+                except Exception, e:
+                    self.refresh_errors += 1
+                    self.last_refresh_error = e
+        thread = threading.Thread(target=run)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        """
+        Returns the size and hit rate of the cache.
+        """
+        return {'size': len(self.cache), 'hits': self.cache.hits,
+                'misses': self.cache.misses,
+                'hit_rate': self.cache.hit_rate(),
+                'added': self.added, 'merged': self.merged,
+                'evicted': self.evicted,
+                'refresh_errors': self.refresh_errors,
+                'last_refresh_error': self.last_refresh_error}
+
+
+__all__ = ["UserCache"]